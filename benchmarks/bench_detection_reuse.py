@@ -0,0 +1,85 @@
+# benchmarks/bench_detection_reuse.py
+"""Latency saved by feeding the MediaPipe box to get_face_encoding.
+
+Usage: python benchmarks/bench_detection_reuse.py path/to/face/images [--repeat 5] [--scale 0.5]
+
+For every image the FaceDetector box is computed once, then the encoding is
+timed three ways: with the default HOG detection pass, with the precomputed
+location on the full frame, and on the padded crop only (encode_face).
+Detection itself is timed at full resolution and at --scale. Images without
+a MediaPipe detection are skipped. The encoding cache is bypassed, otherwise
+every repeat after the first would time a cache hit instead of dlib.
+"""
+import os
+import argparse
+import statistics
+import cv2
+
+from common import image_paths, time_call, write_json
+from face_utils import FaceDetector, bbox_to_face_location, encode_face, get_face_encoding
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('images', help='directory of face images')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per image')
+    parser.add_argument('--scale', type=float, default=0.5, help='downscale factor for detection')
+    parser.add_argument('--json', dest='json_path', help='also write results to this file')
+    args = parser.parse_args()
+
+    paths = image_paths(args.images)
+    detector = FaceDetector()
+    small_detector = FaceDetector(scale=args.scale)
+    hog_ms, reuse_ms, crop_ms, detect_ms, small_detect_ms = [], [], [], [], []
+
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        bbox = detector.detect_face(image)
+        if not bbox:
+            print(f"{os.path.basename(path)}: no face detected, skipped")
+            continue
+        locations = [bbox_to_face_location(bbox)]
+        hog = statistics.median(time_call(lambda: get_face_encoding(image, use_cache=False), args.repeat)[1])
+        reuse = statistics.median(
+            time_call(lambda: get_face_encoding(image, locations, use_cache=False), args.repeat)[1]
+        )
+        crop = statistics.median(time_call(lambda: encode_face(image, bbox, use_cache=False), args.repeat)[1])
+        detect = statistics.median(time_call(lambda: detector.detect_face(image), args.repeat)[1])
+        small_detect = statistics.median(time_call(lambda: small_detector.detect_face(image), args.repeat)[1])
+        hog_ms.append(hog)
+        reuse_ms.append(reuse)
+        crop_ms.append(crop)
+        detect_ms.append(detect)
+        small_detect_ms.append(small_detect)
+        print(f"{os.path.basename(path)}: hog {hog:.1f} ms, reused box {reuse:.1f} ms, crop {crop:.1f} ms, "
+              f"detect {detect:.1f} ms -> {small_detect:.1f} ms at {args.scale}")
+
+    if not hog_ms:
+        print("No usable images found")
+        return
+
+    results = {
+        'images': len(hog_ms),
+        'hog_median_ms': statistics.median(hog_ms),
+        'reused_box_median_ms': statistics.median(reuse_ms),
+        'crop_median_ms': statistics.median(crop_ms),
+        'detect_median_ms': statistics.median(detect_ms),
+        'detect_scaled_median_ms': statistics.median(small_detect_ms),
+        'detect_scale': args.scale,
+        'detect_fallbacks': small_detector.fallbacks,
+    }
+    results['saved_ms'] = results['hog_median_ms'] - results['reused_box_median_ms']
+    print(f"\n{results['images']} images: HOG {results['hog_median_ms']:.1f} ms -> "
+          f"reused box {results['reused_box_median_ms']:.1f} ms "
+          f"(saves {results['saved_ms']:.1f} ms per frame), crop {results['crop_median_ms']:.1f} ms")
+    print(f"detection {results['detect_median_ms']:.1f} ms -> {results['detect_scaled_median_ms']:.1f} ms "
+          f"at scale {args.scale} ({small_detector.fallbacks} full-resolution fallbacks)")
+
+    if args.json_path:
+        write_json(args.json_path, results)
+
+
+if __name__ == '__main__':
+    main()
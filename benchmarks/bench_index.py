@@ -0,0 +1,55 @@
+# benchmarks/bench_index.py
+"""Recall and latency of the IVF face index against exact search.
+
+Usage: python benchmarks/bench_index.py [--size 100000] [--queries 200] [--n-probe 8]
+
+Runs on a synthetic gallery of clustered 128-d encodings (identities plus
+per-capture noise), so no images or camera are needed.
+"""
+import time
+import argparse
+import numpy as np
+
+from common import synthetic_gallery, write_json
+from face_utils import ExactIndex, IVFIndex, evaluate_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000, help='gallery size')
+    parser.add_argument('--queries', type=int, default=200, help='number of probe encodings')
+    parser.add_argument('--n-probe', type=int, default=8, help='IVF lists scanned per query')
+    parser.add_argument('--top-k', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='also write results to this file')
+    args = parser.parse_args()
+
+    ids, encodings = synthetic_gallery(args.size)
+    rng = np.random.default_rng(1)
+    queries = encodings[rng.choice(len(encodings), args.queries)]
+    queries = queries + rng.normal(scale=0.02, size=queries.shape).astype(np.float32)
+
+    exact = ExactIndex(ids, encodings)
+
+    start = time.perf_counter()
+    ivf = IVFIndex.train(encodings, n_probe=args.n_probe)
+    ivf.add(ids, encodings)
+    build_s = time.perf_counter() - start
+
+    results = evaluate_index(ivf, exact, queries, args.top_k)
+    results.update({
+        'gallery_size': args.size,
+        'n_lists': len(ivf.centroids),
+        'n_probe': args.n_probe,
+        'build_s': build_s,
+    })
+    print(f"{args.size} encodings, {results['n_lists']} lists, n_probe {args.n_probe}: "
+          f"recall@{args.top_k} {results['recall']:.3f}, "
+          f"IVF {results['latency_ms']:.2f} ms vs exact {results['reference_latency_ms']:.2f} ms "
+          f"(build {build_s:.1f} s)")
+
+    if args.json_path:
+        write_json(args.json_path, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# benchmarks/bench_inference_server.py
+"""Recognition throughput and UI-thread jitter, in-process vs worker processes.
+
+Usage: python benchmarks/bench_inference_server.py [--images faces/] [--frames 200] [--workers 1 2 4]
+
+"local" recognises frames one at a time on a background thread of this
+process, the way the app did before the inference server. "workers=n"
+submits the same frames to an InferenceClient with n processes, keeping
+two frames per worker in flight. Meanwhile a ticker thread stands in for
+the UI: it wakes every 10 ms and records how late it was, so GIL
+contention from in-process inference shows up as tick lateness.
+
+Every request gets a distinct frame (the loaded images cycled, with the
+low bits changed on each pass) so encodings are never answered from the
+per-process encoding cache and dlib runs every time.
+"""
+import time
+import argparse
+import itertools
+import threading
+from collections import deque
+import cv2
+import numpy as np
+
+from common import image_paths, run_metadata, summarize, write_json
+from face_utils import warm_up_models
+from inference_server import InferenceClient, LocalInference
+
+TICK_MS = 10.0
+
+
+def load_frames(directory, size=(640, 480)):
+    """BGR frames from directory's images, or random noise frames if there is none"""
+    frames = [cv2.resize(image, size) for image in map(cv2.imread, image_paths(directory) if directory else [])
+              if image is not None]
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8) for _ in range(8)]
+    return frames
+
+
+class DistinctFrames:
+    """count frames cycling through base, each pass XOR-ed with its pass number so no two are equal"""
+    def __init__(self, base, count, first_pass=0):
+        self.base = base
+        self.count = count
+        self.first_pass = first_pass
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.count):
+            frame = self.base[i % len(self.base)].copy()
+            n = self.first_pass + i // len(self.base)
+            frame[..., 0] ^= np.uint8(n & 0xff)
+            frame[..., 1] ^= np.uint8((n >> 8) & 0xff)
+            yield frame
+
+
+class Ticker:
+    """Thread that wakes every TICK_MS and records how late each wake-up was"""
+    def __init__(self):
+        self.lateness = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        next_tick = time.perf_counter() + TICK_MS / 1000
+        while not self._stop.is_set():
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+            now = time.perf_counter()
+            self.lateness.append((now - next_tick) * 1000)
+            next_tick = now + TICK_MS / 1000
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_local(frames):
+    local = LocalInference()
+    done = threading.Event()
+
+    def work():
+        for frame in frames:
+            local.recognize(frame)
+        done.set()
+
+    threading.Thread(target=work, daemon=True).start()
+    done.wait()
+
+
+def run_client(client, frames):
+    in_flight = deque()
+    for frame in frames:
+        if len(in_flight) >= client.slot_count:
+            in_flight.popleft().result()
+        in_flight.append(client.submit('recognize', frame))
+    for future in in_flight:
+        future.result()
+
+
+def measure(run, frames):
+    with Ticker() as ticker:
+        start = time.perf_counter()
+        run(frames)
+        elapsed = time.perf_counter() - start
+    return {'fps': len(frames) / elapsed, 'tick_lateness': summarize(ticker.lateness)}
+
+
+def report(name, result):
+    lateness = result['tick_lateness']
+    print(f"{name:>10}: {result['fps']:6.1f} frames/s, UI tick late by "
+          f"median {lateness['median_ms']:.1f} ms, p95 {lateness['p95_ms']:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', help='directory of face images used as frames (default: random frames)')
+    parser.add_argument('--frames', type=int, default=200, help='frames recognised per run')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='worker process counts')
+    parser.add_argument('--json', dest='json_path', help='also write results to this file')
+    args = parser.parse_args()
+
+    base = load_frames(args.images)
+    results = {'meta': run_metadata(), 'frames': args.frames}
+    # Each run starts at a new pass number, so no run sees frames an earlier one encoded
+    runs = itertools.count()
+
+    def frames():
+        return DistinctFrames(base, args.frames, next(runs) * (args.frames // len(base) + 1))
+
+    warm_up_models()
+    run_local(DistinctFrames(base, 2, first_pass=0xffff))
+    results['local'] = measure(run_local, frames())
+    report('local', results['local'])
+
+    for workers in args.workers:
+        client = InferenceClient(workers)
+        client.start()
+        try:
+            # Let every worker load its models
+            run_client(client, DistinctFrames(base, 2 * workers, first_pass=0xffff))
+            results[f'workers={workers}'] = measure(lambda batch: run_client(client, batch), frames())
+        finally:
+            client.stop()
+        report(f'workers={workers}', results[f'workers={workers}'])
+
+    if args.json_path:
+        write_json(args.json_path, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# benchmarks/bench_pipeline.py
+"""Headless benchmark of the detection -> encoding -> matching pipeline.
+
+Usage:
+    python benchmarks/bench_pipeline.py --images path/to/faces --json run.json
+    python benchmarks/bench_pipeline.py --synthetic 20 --gallery-sizes 10 1000 100000
+
+Reports per-stage latency (cvtColor, FaceDetector.detect_face,
+face_recognition locations / encodings, gallery match), end-to-end
+throughput and peak traced memory per gallery size. Synthetic frames contain
+no faces, so detection is timed on misses and encoding uses a centred box.
+Compare two runs with benchmarks/compare.py.
+"""
+import time
+import argparse
+import tracemalloc
+import cv2
+import numpy as np
+import face_recognition
+
+from common import image_paths, run_metadata, summarize, synthetic_gallery, time_call, write_json
+from face_utils import FaceDetector, GalleryMatcher, bbox_to_face_location, build_index
+
+
+def load_frames(args):
+    if args.images:
+        frames = [cv2.imread(path) for path in image_paths(args.images)]
+        return [frame for frame in frames if frame is not None]
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(args.synthetic)]
+
+
+def face_location_for(frame, detector):
+    """MediaPipe box if there is one, otherwise a centred square"""
+    bbox = detector.detect_face(frame)
+    if bbox:
+        return bbox_to_face_location(bbox)
+    h, w = frame.shape[:2]
+    side = min(h, w) // 2
+    top, left = (h - side) // 2, (w - side) // 2
+    return (top, left + side, top + side, left)
+
+
+def bench_stages(frames, detector, repeat):
+    stages = {name: [] for name in ('cvtColor', 'detect_face', 'face_locations', 'face_encodings')}
+    for frame in frames:
+        rgb, timings = time_call(lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), repeat)
+        stages['cvtColor'] += timings
+        stages['detect_face'] += time_call(lambda: detector.detect_face(frame), repeat)[1]
+        stages['face_locations'] += time_call(lambda: face_recognition.face_locations(rgb, model="hog"), repeat)[1]
+        location = face_location_for(frame, detector)
+        stages['face_encodings'] += time_call(lambda: face_recognition.face_encodings(rgb, [location]), repeat)[1]
+    return {name: summarize(timings) for name, timings in stages.items()}
+
+
+def bench_gallery(size, queries, repeat):
+    """Build + match cost and peak traced memory for one gallery size"""
+    tracemalloc.start()
+    ids, encodings = synthetic_gallery(size)
+    start = time.perf_counter()
+    matcher = GalleryMatcher(encodings, ids)
+    index = build_index(ids, encodings)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    exact_ms, index_ms = [], []
+    for query in queries:
+        exact_ms += time_call(lambda: matcher.match(query), repeat)[1]
+        index_ms += time_call(lambda: index.search(query), repeat)[1]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'build_ms': build_ms,
+        'index_backend': index.kind,
+        'exact_match': summarize(exact_ms),
+        'index_search': summarize(index_ms),
+        'peak_memory_mb': peak / 2**20,
+    }
+
+
+def bench_end_to_end(frames, detector, matcher):
+    """Detect -> encode (reusing the box) -> match for every frame, once"""
+    start = time.perf_counter()
+    for frame in frames:
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        location = face_location_for(frame, detector)
+        encodings = face_recognition.face_encodings(rgb, [location])
+        if encodings:
+            matcher.match(encodings[0])
+    elapsed = time.perf_counter() - start
+    return {'frames': len(frames), 'seconds': elapsed, 'fps': len(frames) / elapsed if elapsed else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', help='directory of images (default: synthetic frames)')
+    parser.add_argument('--synthetic', type=int, default=20, help='synthetic frames when --images is not given')
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[10, 1000, 100000])
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per frame and stage')
+    parser.add_argument('--json', dest='json_path', help='write machine-readable results to this file')
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    if not frames:
+        print("No frames to benchmark")
+        return
+    detector = FaceDetector()
+    detector.detect_face(frames[0])  # Exclude graph start-up from the numbers
+
+    results = {'meta': run_metadata(), 'input': args.images or f'synthetic:{len(frames)}'}
+    results['stages'] = bench_stages(frames, detector, args.repeat)
+    for name, summary in results['stages'].items():
+        print(f"{name:>15}: median {summary['median_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms")
+
+    queries = synthetic_gallery(16, seed=1)[1]
+    results['gallery'] = {}
+    for size in args.gallery_sizes:
+        gallery = bench_gallery(size, queries, args.repeat)
+        results['gallery'][str(size)] = gallery
+        print(f"gallery {size:>7}: exact {gallery['exact_match']['median_ms']:.3f} ms, "
+              f"{gallery['index_backend']} {gallery['index_search']['median_ms']:.3f} ms, "
+              f"peak {gallery['peak_memory_mb']:.1f} MB")
+
+    ids, encodings = synthetic_gallery(max(args.gallery_sizes))
+    results['end_to_end'] = bench_end_to_end(frames, detector, GalleryMatcher(encodings, ids))
+    print(f"end to end: {results['end_to_end']['fps']:.1f} frames/s")
+
+    if args.json_path:
+        write_json(args.json_path, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_precision.py
+"""Memory, latency and accuracy of float16 / int8 galleries against float64.
+
+Usage: python benchmarks/bench_precision.py [--size 100000] [--queries 500] [--threshold 0.4]
+
+Each precision is matched against the same synthetic gallery (scaled like
+real face_recognition encodings). The accuracy guardrail is how often the
+best match or the accept decision (distance <= threshold) differs from an
+exact float64 search; a non-zero count means the precision changes what
+users would see and should not be shipped without a closer look.
+"""
+import argparse
+import numpy as np
+
+from common import run_metadata, summarize, synthetic_gallery, time_call, write_json
+from encoding_store import DTYPES
+from face_utils import GalleryMatcher
+
+
+def reference_decisions(encodings, queries, threshold):
+    """Exact float64 best row, distance and accept decision for every query"""
+    gallery = encodings.astype(np.float64)
+    best, best_distance = [], []
+    for query in queries.astype(np.float64):
+        distances = np.linalg.norm(gallery - query, axis=1)
+        best.append(int(np.argmin(distances)))
+        best_distance.append(distances[best[-1]])
+    best_distance = np.array(best_distance)
+    return np.array(best), best_distance, best_distance <= threshold
+
+
+def bench_precision(precision, ids, encodings, queries, reference, threshold, repeat):
+    ref_best, ref_distance, ref_accept = reference
+    matcher = GalleryMatcher(encodings, ids, precision=precision)
+    row_of = {user: row for row, user in enumerate(ids)}
+
+    best, distance, timings = [], [], []
+    for query in queries:
+        result, query_timings = time_call(lambda: matcher.match(query), repeat)
+        timings += query_timings
+        best.append(row_of[result.user])
+        distance.append(1 - result.similarity)
+    best, distance = np.array(best), np.array(distance)
+    accept = distance <= threshold
+
+    return {
+        'gallery_mb': matcher.encodings.nbytes / 2**20,
+        'match': summarize(timings),
+        'changed_best_match': int(np.count_nonzero(best != ref_best)),
+        'changed_accept': int(np.count_nonzero(accept != ref_accept)),
+        'max_distance_error': float(np.max(np.abs(distance - ref_distance))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000, help='gallery size')
+    parser.add_argument('--queries', type=int, default=500, help='number of probe encodings')
+    parser.add_argument('--threshold', type=float, default=0.4,
+                        help='accept distance (SignInPage accepts similarity >= 0.6, i.e. distance <= 0.4)')
+    parser.add_argument('--repeat', type=int, default=1, help='timed runs per query')
+    parser.add_argument('--json', dest='json_path', help='also write results to this file')
+    args = parser.parse_args()
+
+    ids, encodings = synthetic_gallery(args.size, center_scale=0.056, noise=0.025)
+    rng = np.random.default_rng(1)
+    queries = encodings[rng.choice(len(encodings), args.queries)]
+    queries = queries + rng.normal(scale=0.025, size=queries.shape).astype(np.float32)
+    reference = reference_decisions(encodings, queries, args.threshold)
+
+    results = {'meta': run_metadata(), 'gallery_size': args.size, 'threshold': args.threshold, 'precision': {}}
+    for precision in DTYPES:
+        result = bench_precision(precision, ids, encodings, queries, reference, args.threshold, args.repeat)
+        results['precision'][precision] = result
+        print(f"{precision:>8}: {result['gallery_mb']:.1f} MB, median {result['match']['median_ms']:.2f} ms, "
+              f"best match changed {result['changed_best_match']}/{args.queries}, "
+              f"accept changed {result['changed_accept']}/{args.queries}, "
+              f"max distance error {result['max_distance_error']:.4f}")
+
+    if args.json_path:
+        write_json(args.json_path, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/bench_startup.py
+"""Time to first paint of the app with eager vs lazy page loading.
+
+Usage: python benchmarks/bench_startup.py [--repeat 5] [--json startup.json]
+
+Each measurement runs in a fresh interpreter so nothing is cached in
+sys.modules. "eager" does what main.py used to do before showing the
+landing page: import every page module and build the FaceDetectors of the
+sign-in and registration pages. "lazy" imports main.py as it is now, which
+is all the landing page needs; "warm_up" is the background import that
+follows it. The app also records startup.first_paint and startup.warm_up
+spans when FACE_METRICS=1.
+"""
+import sys
+import argparse
+import subprocess
+
+from common import REPO_ROOT, run_metadata, summarize, write_json
+
+SCENARIOS = {
+    'eager': (
+        'import flet, signup, landingpage, signin, register_face, user, display_recognized_user\n'
+        'from face_utils import FaceDetector\n'
+        'FaceDetector(); FaceDetector()\n'
+    ),
+    'lazy': 'import main\n',
+    'warm_up': 'import main\nstart = time.perf_counter()\nmain.warm_up()\n',
+}
+
+
+def run_scenario(code):
+    """Milliseconds spent by code in a fresh interpreter"""
+    script = (
+        'import time\n'
+        'start = time.perf_counter()\n'
+        f'{code}'
+        'print((time.perf_counter() - start) * 1000)\n'
+    )
+    output = subprocess.run([sys.executable, '-c', script], cwd=REPO_ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per scenario')
+    parser.add_argument('--json', dest='json_path', help='also write results to this file')
+    args = parser.parse_args()
+
+    results = {'meta': run_metadata()}
+    for name, code in SCENARIOS.items():
+        try:
+            timings = [run_scenario(code) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"{name}: failed\n{e.stderr}")
+            continue
+        results[name] = summarize(timings)
+        print(f"{name:>8}: median {results[name]['median_ms']:.0f} ms, min {results[name]['min_ms']:.0f} ms")
+
+    if 'eager' in results and 'lazy' in results:
+        results['first_paint_saved_ms'] = results['eager']['median_ms'] - results['lazy']['median_ms']
+        print(f"time to first paint: {results['eager']['median_ms']:.0f} ms -> {results['lazy']['median_ms']:.0f} ms")
+
+    if args.json_path:
+        write_json(args.json_path, results)
+
+
+if __name__ == '__main__':
+    main()
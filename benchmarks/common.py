@@ -0,0 +1,73 @@
+# benchmarks/common.py
+"""Helpers shared by the benchmark scripts."""
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import statistics
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def image_paths(directory):
+    return sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(directory, pattern)))
+
+
+def synthetic_gallery(size, identities=None, seed=0, center_scale=0.3, noise=0.05):
+    """Clustered float32 encodings that look roughly like face_recognition output.
+
+    center_scale=0.056, noise=0.025 matches real encodings more closely (about
+    0.9 between people, 0.4 within one) when absolute distances matter.
+    """
+    rng = np.random.default_rng(seed)
+    identities = identities or max(1, size // 4)
+    centers = rng.normal(scale=center_scale, size=(identities, 128)).astype(np.float32)
+    encodings = centers[rng.integers(0, identities, size)] + rng.normal(scale=noise, size=(size, 128))
+    return [f'user{i}@example.com' for i in range(size)], encodings.astype(np.float32)
+
+
+def time_call(fn, repeat):
+    """Run fn repeat times; returns (last result, list of durations in ms)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, timings
+
+
+def summarize(timings):
+    """Latency summary in ms for a list of durations in ms"""
+    ordered = sorted(timings)
+    return {
+        'n': len(ordered),
+        'mean_ms': statistics.fmean(ordered),
+        'median_ms': statistics.median(ordered),
+        'p95_ms': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        'min_ms': ordered[0],
+    }
+
+
+def run_metadata():
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_json(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {path}")
@@ -0,0 +1,55 @@
+# benchmarks/compare.py
+"""Compare two benchmark JSON files and flag regressions.
+
+Usage: python benchmarks/compare.py baseline.json candidate.json [--threshold 10]
+
+Every numeric field ending in _ms or _mb is compared; a change larger than
+--threshold percent in the slower / bigger direction is reported as a
+regression and makes the script exit with status 1.
+"""
+import sys
+import json
+import argparse
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b_ms': 1}} -> {'a.b_ms': 1}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed change in percent')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = flatten(json.load(f))
+    with open(args.candidate) as f:
+        candidate = flatten(json.load(f))
+
+    regressions = 0
+    for name in sorted(baseline.keys() & candidate.keys()):
+        if not name.endswith(('_ms', '_mb')) or not baseline[name]:
+            continue
+        change = 100 * (candidate[name] - baseline[name]) / baseline[name]
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{name:<50} {baseline[name]:>10.3f} -> {candidate[name]:>10.3f} ({change:+.1f}%){flag}")
+
+    print(f"\n{regressions} regression(s) above {args.threshold:.0f}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+# bulk_enroll.py
+"""Enroll many users from photos without the UI.
+
+Usage:
+    python bulk_enroll.py people.csv            # columns: fullname,email,telephone,image
+    python bulk_enroll.py photos/               # photos named <email>.jpg / .png
+
+Images are detected and encoded across a process pool (one worker per core
+by default) and written to the user repository and encoding store in
+batched transactions. Users already enrolled are skipped, so an
+interrupted run can simply be started again.
+"""
+import os
+import csv
+import glob
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from encoding_store import open_encoding_store
+from face_utils import DUPLICATE_DISTANCE, FACE_INDEX_PATH, encode_face, get_face_detector, open_face_index, warm_up_models
+from thumbnails import get_thumbnail_cache
+from user_store import open_user_repository
+
+FACES_DIR = os.path.join('application_data', 'user_faces')
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+_detector = None
+
+
+def read_manifest(source):
+    """List of {fullname, email, telephone, image} dicts from a CSV or a folder"""
+    if os.path.isdir(source):
+        people = []
+        paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(source, pattern)))
+        for path in paths:
+            email = os.path.splitext(os.path.basename(path))[0]
+            fullname = email.split('@')[0].replace('.', ' ').replace('_', ' ').title()
+            people.append({'fullname': fullname, 'email': email, 'telephone': '', 'image': path})
+        return people
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, newline='') as f:
+        people = list(csv.DictReader(f))
+    for person in people:
+        if not os.path.isabs(person['image']):
+            person['image'] = os.path.join(base_dir, person['image'])
+    return people
+
+
+def _init_worker():
+    global _detector
+    _detector = get_face_detector()
+    warm_up_models()
+
+
+def encode_person(person):
+    """Runs in a worker process: detect and encode the face image.
+
+    Returns (person, encoding, error) with encoding None when it failed. The
+    image comes back JPEG-encoded in person['jpeg'] and is only written to
+    disk once write_batch has accepted the person.
+    """
+    image = cv2.imread(person['image'])
+    if image is None:
+        return person, None, 'unreadable image'
+    face_location = _detector.detect_face(image)
+    if not face_location:
+        return person, None, 'no face detected'
+    encoding = encode_face(image, face_location, persist=True)
+    if encoding is None:
+        return person, None, 'unable to encode face'
+
+    ok, jpeg = cv2.imencode('.jpg', image)
+    if not ok:
+        return person, None, 'unable to encode image'
+    person = dict(person, face_image=os.path.join(FACES_DIR, f"{person['email']}.jpg"), jpeg=jpeg.tobytes())
+    return person, encoding, None
+
+
+def batch_duplicates(new, threshold=DUPLICATE_DISTANCE):
+    """Emails in new [(person, encoding)] whose face matches someone earlier in the same list"""
+    accepted, duplicates = [], set()
+    for person, encoding in new:
+        if accepted:
+            distances = np.linalg.norm(np.array([e for _, e in accepted]) - encoding, axis=1)
+            closest = int(np.argmin(distances))
+            if distances[closest] <= threshold and accepted[closest][0] != person['email']:
+                duplicates.add(person['email'])
+                continue
+        accepted.append((person['email'], encoding))
+    return duplicates
+
+
+def save_face_images(people):
+    """Write accepted people's images and their display thumbnails"""
+    os.makedirs(FACES_DIR, exist_ok=True)
+    for person in people:
+        with open(person['face_image'], 'wb') as f:
+            f.write(person['jpeg'])
+        get_thumbnail_cache().get(person['face_image'])
+
+
+def write_batch(batch, repository, encoding_store, face_index):
+    """Persist one batch: encodings and index entries, then user records.
+
+    Returns the people skipped because their face is already enrolled under
+    another email, either before this batch or earlier in it.
+    """
+    # Encodings left behind by an interrupted run are reused, not duplicated
+    new = [(person, encoding) for person, encoding in batch if person['email'] not in encoding_store]
+    skipped = set()
+    if new and len(face_index):
+        nearest = face_index.search_many([encoding for _, encoding in new])
+        skipped = {
+            person['email'] for (person, _), hits in zip(new, nearest)
+            if hits and hits[0][0] != person['email'] and hits[0][1] <= DUPLICATE_DISTANCE
+        }
+    skipped |= batch_duplicates([(person, encoding) for person, encoding in new if person['email'] not in skipped])
+    duplicates = [person for person, _ in batch if person['email'] in skipped]
+    new = [(person, encoding) for person, encoding in new if person['email'] not in skipped]
+    batch = [(person, encoding) for person, encoding in batch if person['email'] not in skipped]
+    if new:
+        ids = [person['email'] for person, _ in new]
+        encodings = [encoding for _, encoding in new]
+        rows = encoding_store.extend(ids, encodings)
+        # The index only stays a copy of the store while nobody else appends to it
+        in_step = face_index.store_generation is not None and rows[0] == len(face_index)
+        face_index.add(ids, encodings)
+        face_index.store_generation = encoding_store.generation if in_step else None
+    save_face_images(person for person, _ in batch)
+
+    registered = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+    repository.add_users([
+        {
+            "fullname": person['fullname'],
+            "email": person['email'],
+            "telephone": person['telephone'],
+            "face_image": person['face_image'],
+            "face_encoding": encoding_store.path,
+            "date_registered": registered,
+        }
+        for person, _ in batch
+    ])
+    return duplicates
+
+
+def report_duplicates(people):
+    for person in people:
+        print(f"Skipping {person['email']}: face already enrolled under another email")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='CSV manifest or directory of <email>.jpg photos')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='encoding processes')
+    parser.add_argument('--batch-size', type=int, default=64, help='users per database transaction')
+    args = parser.parse_args()
+
+    repository = open_user_repository()
+    encoding_store = open_encoding_store()
+    face_index = open_face_index(encoding_store)
+
+    people = read_manifest(args.source)
+    todo, seen = [], set()
+    for person in people:
+        if person['email'] in seen or repository.get_by_email(person['email']) is not None:
+            continue
+        seen.add(person['email'])
+        todo.append(person)
+    print(f"{len(people)} people, {len(people) - len(todo)} already enrolled, {len(todo)} to process")
+
+    enrolled, failed, duplicates, batch = 0, 0, 0, []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        for person, encoding, error in pool.map(encode_person, todo, chunksize=4):
+            if error:
+                failed += 1
+                print(f"Skipping {person['email']}: {error}")
+                continue
+            batch.append((person, encoding))
+            if len(batch) >= args.batch_size:
+                skipped = write_batch(batch, repository, encoding_store, face_index)
+                report_duplicates(skipped)
+                enrolled += len(batch) - len(skipped)
+                duplicates += len(skipped)
+                batch = []
+                print(f"Enrolled {enrolled}/{len(todo)}")
+        if batch:
+            skipped = write_batch(batch, repository, encoding_store, face_index)
+            report_duplicates(skipped)
+            enrolled += len(batch) - len(skipped)
+            duplicates += len(skipped)
+
+    # Saved once at the end; after an interruption, or if someone else wrote
+    # to the store meanwhile, open_face_index sees the generations differ and rebuilds it
+    if face_index.store_generation is not None:
+        face_index.save(FACE_INDEX_PATH)
+
+    elapsed = time.perf_counter() - start
+    rate = len(todo) / elapsed if elapsed else 0.0
+    print(f"Enrolled {enrolled}, failed {failed}, duplicate faces {duplicates} in {elapsed:.1f} s ({rate:.1f} images/s)")
+
+
+if __name__ == '__main__':
+    main()
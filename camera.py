@@ -0,0 +1,135 @@
+# camera.py
+import time
+import threading
+import cv2
+from metrics import span
+
+
+class CameraService:
+    """One shared webcam handle with a dedicated grabber thread.
+
+    The grabber keeps only the most recent frame in a lock-protected slot.
+    Consumers (preview loops, sign-in and registration captures) read that
+    slot without touching the device, so they never wait on each other or
+    on cv2.VideoCapture.read. Frames are shared between consumers and are
+    marked read-only; copy one before modifying it in place.
+    """
+    def __init__(self, indices=(0, 1), width=640, height=480, max_failed_reads=30):
+        self.indices = indices
+        self.width = width
+        self.height = height
+        self.max_failed_reads = max_failed_reads
+        self.capture = None
+        self.frame = None
+        self.frame_id = 0
+        self.users = 0
+        self.running = False
+        self.thread = None
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Register a consumer, starting the grabber on first use"""
+        with self.condition:
+            self.users += 1
+            self.running = True
+            # A grabber that is still winding down picks the new consumer up
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._grab_frames, daemon=True)
+                self.thread.start()
+
+    def release(self):
+        """Unregister a consumer, closing the device when none are left"""
+        with self.condition:
+            self.users = max(0, self.users - 1)
+            if self.users == 0:
+                self.running = False
+                self.condition.notify_all()
+
+    def is_opened(self):
+        return self.capture is not None and self.capture.isOpened()
+
+    def _open(self):
+        """Open the first camera index that works"""
+        for index in self.indices:
+            capture = cv2.VideoCapture(index)
+            if capture.isOpened():
+                capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+                capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+                return capture
+            capture.release()
+        return None
+
+    def _close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+    def _grab_frames(self):
+        failed_reads = 0
+        while True:
+            with self.condition:
+                if not self.running:
+                    self._close()
+                    self.frame = None
+                    self.thread = None
+                    return
+
+            if not self.is_opened():
+                self._close()
+                self.capture = self._open()
+                if self.capture is None:
+                    print("Error: Could not open camera")
+                    time.sleep(1)
+                    continue
+                failed_reads = 0
+
+            with span('camera.read'):
+                ret, frame = self.capture.read()
+            if not ret or frame is None:
+                failed_reads += 1
+                if failed_reads >= self.max_failed_reads:
+                    # The device went away; reopen it on the next pass
+                    print("Error: Camera stopped delivering frames, reconnecting")
+                    self._close()
+                time.sleep(0.01)
+                continue
+
+            failed_reads = 0
+            frame.flags.writeable = False
+            with self.condition:
+                self.frame = frame
+                self.frame_id += 1
+                self.condition.notify_all()
+
+    def read(self):
+        """Latest frame in cv2.VideoCapture.read style: (ret, frame)"""
+        with self.condition:
+            frame = self.frame
+        return frame is not None, frame
+
+    def wait_for_frame(self, last_frame_id=0, timeout=1.0):
+        """Block until a frame newer than last_frame_id arrives.
+
+        Returns (frame_id, frame); frame is None on timeout or shutdown.
+        """
+        def has_new_frame():
+            return self.frame is not None and self.frame_id > last_frame_id
+
+        with self.condition:
+            self.condition.wait_for(lambda: has_new_frame() or not self.running, timeout=timeout)
+            if has_new_frame():
+                return self.frame_id, self.frame
+            return last_frame_id, None
+
+
+_camera = None
+_camera_lock = threading.Lock()
+
+
+def get_camera():
+    """Process-wide CameraService shared by every page"""
+    global _camera
+    with _camera_lock:
+        if _camera is None:
+            _camera = CameraService()
+        return _camera
@@ -0,0 +1,123 @@
+# compact.py
+"""Remove duplicate enrollments from the user database and encoding store.
+
+Usage:
+    python compact.py --dry-run         # report what would change
+    python compact.py                   # compact in place (the old store is kept as .bak)
+    python compact.py --drop-orphans    # also drop encodings that belong to no user
+
+Keeps the latest user record per email, drops encoding rows that exactly
+repeat an earlier row of the same user and rebuilds the face index. Users
+whose faces look like the same person are listed, not merged: which
+account is right is a decision for a person.
+"""
+import os
+import argparse
+import numpy as np
+
+from encoding_store import EncodingStore, open_encoding_store, replace_store_file, store_lock
+from face_utils import DUPLICATE_DISTANCE, FACE_INDEX_PATH, GalleryMatcher, build_store_index
+from user_store import open_user_repository
+
+
+def rows_to_keep(ids, encodings, emails=None):
+    """Row numbers left after dropping exact repeats (and, given emails, rows of unknown users)"""
+    seen, keep = set(), []
+    for row, user_id in enumerate(ids):
+        if emails is not None and user_id not in emails:
+            continue
+        key = (user_id, encodings[row].tobytes())
+        if key in seen:
+            continue
+        seen.add(key)
+        keep.append(row)
+    return keep
+
+
+def similar_users(ids, encodings, threshold=DUPLICATE_DISTANCE, chunk=256):
+    """[(user_a, user_b, distance)] for different users whose mean encodings are within threshold"""
+    users = sorted(set(ids))
+    if len(users) < 2:
+        return []
+    position = {user: i for i, user in enumerate(users)}
+    groups = np.array([position[user_id] for user_id in ids])
+    means = np.zeros((len(users), encodings.shape[1]), dtype=np.float64)
+    np.add.at(means, groups, encodings)
+    means /= np.bincount(groups, minlength=len(users))[:, None]
+
+    matcher = GalleryMatcher(means, users)
+    pairs = []
+    for start in range(0, len(users), chunk):
+        # Queries go through in chunks so the distance matrix stays small
+        results = matcher.match_many(means[start:start + chunk], top_k=2)
+        for user, result in zip(users[start:start + chunk], results):
+            for other, similarity in result.top_k:
+                if user < other and 1 - similarity <= threshold:
+                    pairs.append((user, other, 1 - similarity))
+    return pairs
+
+
+def rewrite_store(store, rows):
+    """Replace store's file with only the given rows; returns the reopened store.
+
+    Rows appended by another process after rows were chosen are kept too.
+    """
+    with store_lock(store.path):
+        known = len(store)
+        store.refresh()
+        ids = store.ids()
+        encodings = np.asarray(store.encodings())
+        rows = list(rows) + list(range(known, len(ids)))
+        tmp_path = store.path + '.compact'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        compacted = EncodingStore(tmp_path, dim=store.dim, id_width=store.id_width, dtype=store.dtype,
+                                  scale=store.scale)
+        if rows:
+            compacted.extend([ids[row] for row in rows], encodings[rows])
+        compacted.close()
+        del encodings  # a view of the old mapping, which Windows would not let go of
+        store.close()
+        replace_store_file(store.path, store.path + '.bak')
+        replace_store_file(tmp_path, store.path)
+        return EncodingStore(store.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='only report what would change')
+    parser.add_argument('--drop-orphans', action='store_true', help='drop encodings of emails with no user record')
+    parser.add_argument('--threshold', type=float, default=DUPLICATE_DISTANCE,
+                        help='face distance reported as the same person')
+    args = parser.parse_args()
+
+    repository = open_user_repository()
+    store = open_encoding_store()
+    users = repository.all_users()
+    emails = {user['email'] for user in users}
+    duplicate_records = len(users) - len(emails)
+
+    ids = store.ids()
+    encodings = np.asarray(store.encodings())
+    keep = rows_to_keep(ids, encodings, emails if args.drop_orphans else None)
+    print(f"{len(users)} user records ({duplicate_records} duplicate emails), "
+          f"{len(ids)} encodings ({len(ids) - len(keep)} to drop)")
+
+    for user_a, user_b, distance in similar_users([ids[row] for row in keep], encodings[keep], args.threshold):
+        print(f"Possible same person: {user_a} and {user_b} (distance {distance:.3f})")
+
+    if args.dry_run:
+        return
+    if duplicate_records:
+        print(f"Removed {repository.remove_duplicate_emails()} duplicate user records")
+    if len(keep) < len(ids):
+        store = rewrite_store(store, keep)
+        print(f"Rewrote {store.path} with {len(store)} encodings (previous file kept as {store.path}.bak)")
+    with store_lock(store.path):
+        store.refresh()
+        build_store_index(store).save(FACE_INDEX_PATH)
+    print(f"Rebuilt {FACE_INDEX_PATH}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,5 @@
 import flet as ft
-import os, io, base64
-from PIL import Image
+from thumbnails import get_thumbnail_cache
 
 class DisplayRecognizedUser(ft.UserControl):
     def __init__(self, page, user_data):
@@ -27,13 +26,8 @@ class DisplayRecognizedUser(ft.UserControl):
         )
 
     def load_image(self, path):
-        if os.path.exists(path):
-            with Image.open(path) as img:
-                img = img.resize((299, 299)) # resize image for display
-                buffered = io.BytesIO()
-                img.save(buffered, format='PNG')
-                return base64.b64encode(buffered.getvalue()).decode()
-        return None
+        # Thumbnails are rendered once and cached, not on every build
+        return get_thumbnail_cache().get(path)
 
     def build(self):
         if not self.user_data:
@@ -0,0 +1,429 @@
+# encoding_store.py
+import os
+import gc
+import glob
+import argparse
+import struct
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+ENCODING_STORE_PATH = os.path.join('application_data', 'face_encodings.bin')
+LEGACY_ENCODING_DIR = os.path.join('application_data', 'user_faces_encoding')
+
+# File layout (version 2): header | dim float32 scales | capacity * dim rows | capacity * id_width id table
+# Version 1 files have no scale table and always hold float32 rows.
+# The header ends with a random generation, replaced whenever rows are written,
+# so a saved index can tell whether it still matches the store.
+MAGIC = b'FENC'
+VERSION = 2
+HEADER_FORMAT = '<4sIIQQIBQ'
+HEADER_SIZE = 64
+
+# Row storage types, by the code kept in the header
+DTYPES = ('float32', 'float16', 'int8')
+# Default int8 range: face_recognition encodings stay well inside +-0.5
+INT8_CLIP = 0.5
+
+
+class _FileLock:
+    def __init__(self):
+        self.thread_lock = threading.RLock()
+        self.file = None
+        self.depth = 0
+
+
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    # msvcrt locks a byte range at the file position, and LK_LOCK gives up
+    # after about 10 seconds, so keep trying until the holder lets go
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            pass
+
+
+def _unlock_file(f):
+    if fcntl is None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    # flock is released when the file is closed
+
+
+@contextmanager
+def store_lock(path):
+    """Hold the store at path against other threads and processes.
+
+    Reentrant within a thread. The lock (flock, or msvcrt.locking on
+    Windows) is taken on path + '.lock' rather than on the store, because growing or compacting the store replaces its
+    file and a lock on the old file would no longer exclude anybody.
+    """
+    key = os.path.abspath(path)
+    with _file_locks_guard:
+        lock = _file_locks.setdefault(key, _FileLock())
+    with lock.thread_lock:
+        if lock.depth == 0:
+            os.makedirs(os.path.dirname(key), exist_ok=True)
+            lock.file = open(key + '.lock', 'a+b')
+            _lock_file(lock.file)
+        lock.depth += 1
+        try:
+            yield
+        finally:
+            lock.depth -= 1
+            if lock.depth == 0:
+                try:
+                    _unlock_file(lock.file)
+                finally:
+                    lock.file.close()
+                    lock.file = None
+
+
+def replace_store_file(source, destination):
+    """os.replace for swapping a rewritten store file in.
+
+    Windows refuses to replace a file that is still memory-mapped. Views
+    this process dropped may only be waiting for garbage collection, so
+    collect and retry once. Another process's mapping stays until that
+    process closes the store, so the error then names the fix.
+    """
+    try:
+        os.replace(source, destination)
+    except PermissionError as e:
+        if os.name != 'nt':
+            raise
+        gc.collect()
+        try:
+            os.replace(source, destination)
+        except PermissionError:
+            raise RuntimeError(f"{destination} is open in another program (the app or bulk_enroll); "
+                               "on Windows close it before the store is grown, compacted or converted") from e
+
+
+def _new_generation():
+    return int.from_bytes(os.urandom(8), 'little')
+
+
+def quantize(encodings, dtype, scale=None):
+    """Convert float encodings to dtype storage; returns (rows, scale).
+
+    int8 uses symmetric per-dimension scales (derived from the data when not
+    given); float32 and float16 need no scale and return None for it.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32)
+    if dtype == 'int8':
+        if scale is None:
+            scale = np.maximum(np.abs(encodings).max(axis=0), 1e-6) / 127
+        scale = np.asarray(scale, dtype=np.float32)
+        return np.clip(np.rint(encodings / scale), -127, 127).astype(np.int8), scale
+    return encodings.astype(dtype), None
+
+
+def dequantize(rows, scale=None):
+    """float32 encodings back from quantize() output"""
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows * scale if scale is not None else rows
+
+
+class EncodingStore:
+    """Single packed file holding every face encoding, opened with np.memmap.
+
+    Rows are fixed-width vectors and each row has a matching entry in the id
+    table (the user's email). Space is preallocated in doubling steps so
+    enrolling a user writes one row in place instead of a new file.
+
+    dtype picks the row storage for a new store: float32, float16 (half the
+    row size) or int8 with per-dimension scales (a quarter). It is read from the
+    header for existing files. encodings() and get() always return float32.
+
+    Several processes may append to the same file (the app and bulk_enroll):
+    extend() takes store_lock and first picks up rows or growth written by
+    other handles since this one last looked.
+    """
+    def __init__(self, path=ENCODING_STORE_PATH, dim=128, id_width=256, dtype='float32', scale=None):
+        self.path = path
+        self.dim = dim
+        self.id_width = id_width
+        self.dtype = dtype
+        self.scale = None
+        self.version = VERSION
+        self.count = 0
+        self.capacity = 0
+        self._rows = None
+        self._ids = None
+        self._index = None
+        self._inode = None
+        self.generation = 0
+
+        with store_lock(path):
+            if os.path.exists(path):
+                self._read_header()
+            else:
+                if dtype not in DTYPES:
+                    raise ValueError(f"Unsupported encoding dtype {dtype}")
+                if dtype == 'int8':
+                    self.scale = np.asarray(
+                        scale if scale is not None else np.full(dim, INT8_CLIP / 127), dtype=np.float32
+                    )
+                self._create(capacity=64)
+            self._map()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, user_id):
+        return user_id in self._id_index()
+
+    def _read_header(self):
+        with open(self.path, 'rb') as f:
+            header = f.read(struct.calcsize(HEADER_FORMAT))
+        magic, version, dim, count, capacity, id_width, dtype_code, generation = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not an encoding store")
+        if version not in (1, VERSION):
+            raise ValueError(f"Unsupported encoding store version {version}")
+        self.version, self.dim, self.count, self.capacity, self.id_width = version, dim, count, capacity, id_width
+        self.generation = generation
+        self.dtype = DTYPES[dtype_code]
+        if self.dtype == 'int8':
+            self.scale = np.fromfile(self.path, dtype=np.float32, count=dim, offset=HEADER_SIZE)
+
+    def _write_header(self, f):
+        header = struct.pack(HEADER_FORMAT, MAGIC, self.version, self.dim, self.count, self.capacity,
+                             self.id_width, DTYPES.index(self.dtype), self.generation)
+        f.seek(0)
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        if self.version >= 2:
+            scale = self.scale if self.scale is not None else np.ones(self.dim, dtype=np.float32)
+            f.write(scale.astype(np.float32).tobytes())
+
+    @property
+    def _rows_offset(self):
+        return HEADER_SIZE + (self.dim * 4 if self.version >= 2 else 0)
+
+    @property
+    def _row_bytes(self):
+        return self.dim * np.dtype(self.dtype).itemsize
+
+    def _file_size(self, capacity):
+        return self._rows_offset + capacity * (self._row_bytes + self.id_width)
+
+    def _create(self, capacity):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.count = 0
+        self.capacity = capacity
+        self.generation = _new_generation()
+        with open(self.path, 'wb') as f:
+            f.truncate(self._file_size(capacity))
+            self._write_header(f)
+
+    def _map(self):
+        rows_offset = self._rows_offset
+        ids_offset = rows_offset + self.capacity * self._row_bytes
+        self._rows = np.memmap(self.path, dtype=self.dtype, mode='r+', offset=rows_offset,
+                               shape=(self.capacity, self.dim))
+        self._ids = np.memmap(self.path, dtype=f'S{self.id_width}', mode='r+', offset=ids_offset,
+                              shape=(self.capacity,))
+        self._inode = os.stat(self.path).st_ino
+
+    def refresh(self):
+        """Catch up with rows and growth written through other handles or processes"""
+        with store_lock(self.path):
+            inode = os.stat(self.path).st_ino
+            count, capacity = self.count, self.capacity
+            self._read_header()
+            if inode != self._inode or self.capacity != capacity:
+                # Another handle grew or rewrote the file: map the current one
+                self._unmap()
+                self._map()
+                self._index = None
+            elif self.count != count:
+                self._index = None
+
+    def _unmap(self):
+        for view in (self._rows, self._ids):
+            if view is not None:
+                view.flush()
+        # Views handed out by encodings() keep the old mapping alive until
+        # they are garbage collected, so the mapping is dropped, not closed
+        self._rows = self._ids = None
+
+    def _grow(self):
+        """Double the capacity by rewriting into a new file and swapping it in"""
+        capacity = self.capacity
+        new_capacity = max(64, capacity * 2)
+        rows = np.array(self._rows[:self.count])
+        ids = np.array(self._ids[:self.count])
+        self._unmap()
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.truncate(self._file_size(new_capacity))
+            f.seek(self._rows_offset)
+            f.write(rows.tobytes())
+            f.seek(self._rows_offset + new_capacity * self._row_bytes)
+            f.write(ids.tobytes())
+            self.capacity = new_capacity
+            self._write_header(f)
+        try:
+            replace_store_file(tmp_path, self.path)
+        except Exception:
+            # Keep using the old file
+            os.remove(tmp_path)
+            self.capacity = capacity
+            self._map()
+            raise
+        self._map()
+
+    def _id_index(self):
+        """Lazily built map of user id -> row numbers"""
+        if self._index is None:
+            index = {}
+            for row, raw in enumerate(self._ids[:self.count]):
+                index.setdefault(raw.decode('utf-8'), []).append(row)
+            self._index = index
+        return self._index
+
+    def ids(self):
+        """User id for every stored row, in row order"""
+        return [raw.decode('utf-8') for raw in self._ids[:self.count]]
+
+    def raw_encodings(self):
+        """(count, dim) view onto the rows as stored (no copy); see self.scale for int8"""
+        return self._rows[:self.count]
+
+    def encodings(self):
+        """(count, dim) float32 encodings; a view for float32 stores, a copy otherwise"""
+        if self.dtype == 'float32':
+            return self._rows[:self.count]
+        return dequantize(self._rows[:self.count], self.scale)
+
+    def get(self, user_id):
+        """All encodings stored for user_id as a (k, dim) float32 array, or None"""
+        rows = self._id_index().get(user_id)
+        if not rows:
+            return None
+        return dequantize(self._rows[rows], self.scale)
+
+    def append(self, user_id, encoding):
+        """Add one encoding for user_id and persist it"""
+        return self.extend([user_id], [encoding])[0]
+
+    def extend(self, user_ids, encodings):
+        """Add several encodings with a single header update; returns their rows"""
+        encoded_ids = [user_id.encode('utf-8') for user_id in user_ids]
+        for user_id, encoded_id in zip(user_ids, encoded_ids):
+            if len(encoded_id) > self.id_width:
+                raise ValueError(f"User id longer than {self.id_width} bytes: {user_id}")
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(len(encoded_ids), self.dim)
+
+        with store_lock(self.path):
+            self.refresh()
+            encodings, _ = quantize(encodings, self.dtype, self.scale)
+            while self.count + len(encoded_ids) > self.capacity:
+                self._grow()
+            start = self.count
+            end = start + len(encoded_ids)
+            self._rows[start:end] = encodings
+            self._ids[start:end] = encoded_ids
+            self._rows.flush()
+            self._ids.flush()
+
+            self.count = end
+            self.generation = _new_generation()
+            with open(self.path, 'r+b') as f:
+                self._write_header(f)
+            if self._index is not None:
+                for row, user_id in enumerate(user_ids, start):
+                    self._index.setdefault(user_id, []).append(row)
+        return list(range(start, end))
+
+    def close(self):
+        with store_lock(self.path):
+            self._unmap()
+
+
+def import_npy_files(store, directory=LEGACY_ENCODING_DIR):
+    """Copy legacy per-user {email}_encoding.npy files into store.
+
+    Ids already present in the store are skipped, so running it twice is safe.
+    Returns the number of encodings imported.
+    """
+    imported = 0
+    for path in sorted(glob.glob(os.path.join(directory, '*_encoding.npy'))):
+        user_id = os.path.basename(path)[:-len('_encoding.npy')]
+        if user_id in store:
+            continue
+        try:
+            encoding = np.load(path)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        store.append(user_id, encoding)
+        imported += 1
+    return imported
+
+
+def open_encoding_store(path=ENCODING_STORE_PATH):
+    """Open the default store, migrating legacy .npy files the first time"""
+    # Held across creation and import so only the process that created the store imports
+    with store_lock(path):
+        is_new = not os.path.exists(path)
+        store = EncodingStore(path)
+        if is_new and os.path.isdir(LEGACY_ENCODING_DIR):
+            imported = import_npy_files(store, LEGACY_ENCODING_DIR)
+            print(f"Imported {imported} face encodings into {path}")
+    return store
+
+
+def convert_store(source, destination, dtype):
+    """Copy every row of source into a new store at destination using dtype.
+
+    int8 scales are fitted to the rows being copied, with headroom so later
+    enrollments are rarely clipped. Returns the new store.
+    """
+    if os.path.exists(destination):
+        raise ValueError(f"{destination} already exists")
+    encodings = np.asarray(source.encodings(), dtype=np.float32)
+    scale = None
+    if dtype == 'int8' and len(encodings):
+        scale = np.maximum(np.abs(encodings).max(axis=0) * 1.25, 1e-6) / 127
+    converted = EncodingStore(destination, dim=source.dim, id_width=source.id_width, dtype=dtype, scale=scale)
+    if len(encodings):
+        converted.extend(source.ids(), encodings)
+    return converted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the face encoding store')
+    parser.add_argument('--convert', choices=DTYPES,
+                        help='rewrite the store with this row type (the original is kept as .bak)')
+    args = parser.parse_args()
+
+    store = EncodingStore()
+    if args.convert:
+        tmp_path = store.path + '.convert'
+        with store_lock(store.path):
+            converted = convert_store(store, tmp_path, args.convert)
+            converted.close()
+            store.close()
+            replace_store_file(store.path, store.path + '.bak')
+            replace_store_file(tmp_path, store.path)
+        print(f"Converted {len(converted)} encodings in {store.path} to {args.convert}")
+    else:
+        print(f"Imported {import_npy_files(store)} face encodings into {store.path}")
@@ -1,39 +1,244 @@
 # face_utils.py
+import os
+import time
+import tempfile
+import hashlib
+import threading
 import cv2
 import numpy as np
-import mediapipe as mp
-import face_recognition
+from collections import OrderedDict, namedtuple
+from metrics import span, timed
+from encoding_store import INT8_CLIP, dequantize, quantize
+
+# mediapipe and face_recognition (which loads the dlib models) take seconds to
+# import, so they are imported on first use rather than with this module
+
+# Neither the MediaPipe graph nor the dlib models may be used from two threads
+# at once; FaceDetector has its own lock and dlib calls go through this one
+_encoder_lock = threading.Lock()
+
+FACE_INDEX_PATH = os.path.join('application_data', 'face_index.npz')
+ENCODING_CACHE_DIR = os.path.join('application_data', 'encoding_cache')
+# Bump when anything that changes encodings for the same pixels changes
+ENCODING_CACHE_VERSION = 1
+# Within this distance two encodings are the same person (face_recognition's default tolerance)
+MATCH_DISTANCE = 0.6
+# Closer than this counts as one person enrolled under two accounts; stricter than
+# MATCH_DISTANCE so that look-alikes can still register
+DUPLICATE_DISTANCE = 0.45
+
+MatchResult = namedtuple('MatchResult', ['user', 'similarity', 'top_k', 'distances'])
+
+
+def _save_npz(path, **arrays):
+    """np.savez to path through a temp file of its own, so concurrent writers never share one"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
 class FaceDetector:
-    def __init__(self):
+    """MediaPipe face detector, optionally running on a downscaled frame.
+
+    With scale < 1 detection runs on a resized copy and the box is mapped
+    back to full resolution; a miss is retried at full resolution so a small
+    face is never lost to the downscale. With auto_scale the factor moves
+    along scale_steps to keep detection near target_ms, and steps back up
+    whenever the full-resolution retry finds a face the small frame missed.
+    """
+    scale_steps = (1.0, 0.75, 0.5, 0.35, 0.25)
+    tune_every = 10
+
+    def __init__(self, scale=1.0, auto_scale=False, target_ms=10.0):
+        import mediapipe as mp
         self.mp_face_detection = mp.solutions.face_detection
         self.face_detection = self.mp_face_detection.FaceDetection(min_detection_confidence=0.5)
-        
-    def detect_face(self, image):
-        """Detect face using MediaPipe and return face location"""
+        self.scale = scale
+        self.auto_scale = auto_scale
+        self.target_ms = target_ms
+        self.latency_ms = None
+        self.calls = 0
+        self.fallbacks = 0
+        self.lock = threading.Lock()
+
+    def _detect(self, image):
+        """Relative bounding boxes of every face in image, most confident first"""
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         results = self.face_detection.process(image_rgb)
-        
         if results.detections:
-            detection = results.detections[0]  # Get the first detected face
-            bbox = detection.location_data.relative_bounding_box
-            
-            h, w, _ = image.shape
-            x = int(bbox.xmin * w)
-            y = int(bbox.ymin * h)
-            width = int(bbox.width * w)
-            height = int(bbox.height * h)
-            
-            # Add padding to ensure the whole face is captured
-            padding = 20
-            x = max(0, x - padding)
-            y = max(0, y - padding)
-            width = min(w - x, width + 2*padding)
-            height = min(h - y, height + 2*padding)
-            
-            return (x, y, width, height)
+            return [detection.location_data.relative_bounding_box for detection in results.detections]
+        return []
+
+    def _set_scale(self, scale):
+        if scale != self.scale:
+            self.scale = scale
+            self.latency_ms = None
+
+    def _tune(self, elapsed_ms, missed):
+        """Move one step along scale_steps based on latency and misses"""
+        steps = [step for step in self.scale_steps if step != self.scale]
+        larger = [step for step in steps if step > self.scale]
+        smaller = [step for step in steps if step < self.scale]
+        if missed:
+            # The downscale lost a face the full frame had: back off
+            if larger:
+                self._set_scale(min(larger))
+            return
+        self.latency_ms = elapsed_ms if self.latency_ms is None else 0.8 * self.latency_ms + 0.2 * elapsed_ms
+        self.calls += 1
+        if self.calls % self.tune_every:
+            return
+        if self.latency_ms > self.target_ms and smaller:
+            self._set_scale(max(smaller))
+        elif larger and self.latency_ms * (min(larger) / self.scale) ** 2 < 0.8 * self.target_ms:
+            self._set_scale(min(larger))
+
+    def warm_up(self, image):
+        """Run the graph once so its start-up cost is not paid by a real frame"""
+        with self.lock:
+            self._detect(image)
+
+    @timed('detect_face')
+    def detect_face(self, image):
+        """Detect face using MediaPipe and return face location"""
+        with self.lock:
+            bboxes = self._detect_scaled(image)
+        if bboxes:
+            return self._to_pixels(bboxes[0], image.shape)  # Get the first detected face
         return None
+
+    @timed('detect_faces')
+    def detect_faces(self, image):
+        """Locations of every face in image as (x, y, w, h) boxes, most confident first"""
+        with self.lock:
+            bboxes = self._detect_scaled(image)
+        return [self._to_pixels(bbox, image.shape) for bbox in bboxes]
+
+    def _detect_scaled(self, image):
+        start = time.perf_counter()
+        if self.scale < 1.0:
+            small = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            bboxes = self._detect(small)
+        else:
+            bboxes = self._detect(image)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        missed = False
+        if not bboxes and self.scale < 1.0:
+            # Guardrail: nothing found on the small frame, retry at full resolution
+            with span('detect_face.fallback'):
+                bboxes = self._detect(image)
+            missed = bool(bboxes)
+            self.fallbacks += missed
+        if self.auto_scale:
+            self._tune(elapsed_ms, missed)
+        return bboxes
+
+    @staticmethod
+    def _to_pixels(bbox, shape):
+        """Padded (x, y, w, h) pixel box for a relative MediaPipe box.
+
+        The box is relative, so it maps straight back to full resolution.
+        """
+        h, w = shape[:2]
+        x = int(bbox.xmin * w)
+        y = int(bbox.ymin * h)
+        width = int(bbox.width * w)
+        height = int(bbox.height * h)
+        
+        # Add padding to ensure the whole face is captured
+        padding = 20
+        x = max(0, x - padding)
+        y = max(0, y - padding)
+        width = min(w - x, width + 2*padding)
+        height = min(h - y, height + 2*padding)
+        
+        return (x, y, width, height)
     
+class FaceTracker:
+    """Follow a face between frames instead of detecting it on every frame.
+
+    After a FaceDetector hit the face region is kept as a small grayscale
+    template and later frames are searched with normalised cross-correlation
+    around the previous box. Full detection runs again every redetect_every
+    frames, when the correlation drops below min_confidence, or after the
+    face is lost. detect_face() returns the same (x, y, w, h) boxes as
+    FaceDetector.detect_face, so the two are interchangeable. Boxes narrower
+    or shorter than min_box_size (e.g. clipped at the frame edge) count as
+    no face.
+    """
+    min_box_size = 8
+
+    def __init__(self, detector, redetect_every=10, min_confidence=0.7, search_margin=0.5, template_size=48):
+        self.detector = detector
+        self.redetect_every = redetect_every
+        self.min_confidence = min_confidence
+        self.search_margin = search_margin
+        self.template_size = template_size
+        self.reset()
+
+    def reset(self):
+        self.box = None
+        self.template = None
+        self.template_scale = 1.0
+        self.confidence = 0.0
+        self.tracked_frames = 0
+
+    def _start(self, gray, box):
+        """Take a new template from a detected box"""
+        self.reset()
+        if not box:
+            return
+        x, y, w, h = box
+        scale = min(1.0, self.template_size / max(w, h))
+        patch = gray[y:y + h, x:x + w]
+        if patch.size == 0:
+            return
+        self.box = box
+        self.template_scale = scale
+        self.template = cv2.resize(patch, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        self.confidence = 1.0
+
+    def _track(self, gray):
+        """(box, score) of the best template match near the previous box"""
+        x, y, w, h = self.box
+        height, width = gray.shape
+        margin_x, margin_y = int(w * self.search_margin), int(h * self.search_margin)
+        left, top = max(0, x - margin_x), max(0, y - margin_y)
+        right, bottom = min(width, x + w + margin_x), min(height, y + h + margin_y)
+        scale = self.template_scale
+        region = cv2.resize(gray[top:bottom, left:right], None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if region.shape[0] < self.template.shape[0] or region.shape[1] < self.template.shape[1]:
+            return None, 0.0
+        scores = cv2.matchTemplate(region, self.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (best_x, best_y) = cv2.minMaxLoc(scores)
+        new_x = min(width - w, left + int(round(best_x / scale)))
+        new_y = min(height - h, top + int(round(best_y / scale)))
+        return (new_x, new_y, w, h), score
+
+    @timed('track_face')
+    def detect_face(self, image):
+        """Tracked (x, y, w, h) face box, falling back to full detection"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if self.box is not None and self.tracked_frames < self.redetect_every:
+            box, score = self._track(gray)
+            if box is not None and score >= self.min_confidence:
+                self.box, self.confidence = box, score
+                self.tracked_frames += 1
+                return box
+        box = self.detector.detect_face(image)
+        if box and min(box[2], box[3]) < self.min_box_size:
+            box = None
+        self._start(gray, box)
+        return box
+
 # Function to align face using MediaPipe
 def align_face(image, landmarks):
     left_eye = landmarks.landmark[33]
@@ -63,24 +268,735 @@ def align_face(image, landmarks):
 
     return resized
 
-def get_face_encoding(image):
-    """Get face encoding using face_recognition library"""
+def sharpness(image):
+    """Variance of the Laplacian: a cheap blur score, higher is sharper"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+def box_iou(box_a, box_b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    intersection = inter_w * inter_h
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union > 0 else 0.0
+
+def bbox_to_face_location(bbox):
+    """Convert a FaceDetector (x, y, w, h) box to face_recognition's (top, right, bottom, left)"""
+    x, y, width, height = bbox
+    return (y, x + width, y + height, x)
+
+class EncodingCache:
+    """Face encodings keyed by a hash of the exact pixels they came from.
+
+    Lookups go to an in-memory LRU of memory_items entries first, then to
+    one small .npz file per key under directory. The directory is kept under
+    max_disk_bytes by deleting the least recently used files. Only puts with
+    persist=True are written to disk, so live camera frames, which never
+    repeat, stay in memory.
+    """
+    def __init__(self, directory=ENCODING_CACHE_DIR, memory_items=256, max_disk_bytes=64 * 2**20):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.disk_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(image, face_locations, params):
+        """Content hash of image (pixels, shape, dtype), the locations and model params"""
+        image = np.ascontiguousarray(image)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{ENCODING_CACHE_VERSION}|{image.shape}|{image.dtype}|{face_locations}|{params}".encode())
+        digest.update(image.data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.npz')
+
+    def get(self, key):
+        """Cached (face_locations, encodings) for key, or None"""
+        with self.lock:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return value
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                value = ([tuple(int(v) for v in location) for location in data['locations']],
+                         data['encodings'])
+            os.utime(path)  # Keeps recently used files out of eviction
+        except (OSError, ValueError, KeyError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value, persist=False):
+        self._remember(key, value)
+        if persist:
+            try:
+                self._write(key, value)
+            except OSError as e:
+                print(f"Error writing encoding cache: {e}")
+
+    def _remember(self, key, value):
+        value[1].setflags(write=False)
+        with self.lock:
+            self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+
+    def _write(self, key, value):
+        face_locations, encodings = value
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _save_npz(path, locations=np.array(face_locations, dtype=np.int64).reshape(-1, 4), encodings=encodings)
+        with self.lock:
+            if self.disk_bytes is None:
+                self.disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self.disk_bytes += os.path.getsize(path)
+            if self.disk_bytes <= self.max_disk_bytes:
+                return
+            self._evict()
+
+    def _disk_entries(self):
+        """(mtime, size, path) for every cached file"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Delete least recently used files until the cache is at 90% of its bound"""
+        entries = sorted(self._disk_entries())
+        self.disk_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.disk_bytes <= 0.9 * self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # Another process got there first
+            self.disk_bytes -= size
+
+_encoding_cache = None
+_detector = None
+_models_lock = threading.Lock()
+_warmed_up = False
+_warm_up_lock = threading.Lock()
+
+def get_face_detector():
+    """Process-wide FaceDetector, built once and safe to share between threads"""
+    global _detector
+    with _models_lock:
+        if _detector is None:
+            _detector = FaceDetector(auto_scale=True)
+        return _detector
+
+def get_encoding_cache():
+    """Process-wide EncodingCache used by get_face_encodings"""
+    global _encoding_cache
+    with _models_lock:
+        if _encoding_cache is None:
+            _encoding_cache = EncodingCache()
+        return _encoding_cache
+
+@timed('warm_up_models')
+def warm_up_models():
+    """Load every model and run it once on a blank frame.
+
+    Called from a background thread at startup so the first sign-in pays the
+    same latency as later ones instead of MediaPipe graph start-up and dlib
+    model loading. Later calls return immediately.
+    """
+    global _warmed_up
+    with _warm_up_lock:
+        if _warmed_up:
+            return
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        get_face_detector().warm_up(frame)
+        get_face_encoding(frame, detect_scale=0.5)
+        get_face_encoding(frame, [(140, 420, 340, 220)])
+        _warmed_up = True
+
+def crop_face(image, bbox, margin=0.25):
+    """Crop an (x, y, w, h) box plus margin (a fraction of its size) out of image.
+
+    Returns (crop, face_location) with the face_recognition location in crop coordinates.
+    """
+    x, y, width, height = bbox
+    h, w = image.shape[:2]
+    left = max(0, x - int(width * margin))
+    top = max(0, y - int(height * margin))
+    right = min(w, x + width + int(width * margin))
+    bottom = min(h, y + height + int(height * margin))
+    return image[top:bottom, left:right], (y - top, x + width - left, y + height - top, x - left)
+
+def _hog_face_locations(rgb_image, scale=1.0):
+    """HOG face locations, found on a downscaled copy when scale < 1 and mapped back"""
+    import face_recognition
+    if scale < 1.0:
+        small = cv2.resize(rgb_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        face_locations = face_recognition.face_locations(small, model="hog")
+        if face_locations:
+            return [tuple(int(round(v / scale)) for v in location) for location in face_locations]
+    return face_recognition.face_locations(rgb_image, model="hog")
+
+@timed('get_face_encodings')
+def get_face_encodings(image, face_locations=None, detect_scale=1.0, persist=False, use_cache=True):
+    """Encode every face in image with a single face_recognition call.
+
+    Returns (face_locations, encodings) where encodings is an (M, 128)
+    array in the same order; M is 0 when no face is found. Results are
+    cached by image content, also on disk with persist=True (photos that
+    will be seen again, as opposed to live frames). use_cache=False always
+    runs the models, e.g. when timing them.
+    """
+    import face_recognition
+    if use_cache:
+        cache = get_encoding_cache()
+        params = f"{getattr(face_recognition, '__version__', '')}|hog:{detect_scale}|jitters:1|small"
+        with span('encoding_cache.lookup'):
+            key = cache.key(image, face_locations, params)
+            cached = cache.get(key)
+        if cached is not None:
+            return cached
+
     rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    face_locations = face_recognition.face_locations(rgb_image, model="hog")
+    if face_locations is None:
+        with span('face_locations'), _encoder_lock:
+            face_locations = _hog_face_locations(rgb_image, detect_scale)
     
+    face_encodings = []
     if face_locations:
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
-        if face_encodings:
-            return face_encodings[0]
+        with span('face_encodings'), _encoder_lock:
+            face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
+    result = (list(face_locations), np.array(face_encodings).reshape(-1, 128))
+    if use_cache:
+        cache.put(key, result, persist)
+    return result
+
+@timed('get_face_encoding')
+def get_face_encoding(image, face_locations=None, detect_scale=1.0, persist=False, use_cache=True):
+    """Get face encoding using face_recognition library
+
+    Pass face_locations (e.g. [bbox_to_face_location(face_detector.detect_face(image))])
+    to skip the HOG detection pass when the face has already been located.
+    Otherwise detect_scale < 1 runs HOG on a downscaled copy (falling back
+    to full resolution when it finds nothing) and encodes at full resolution.
+    """
+    _, face_encodings = get_face_encodings(image, face_locations, detect_scale, persist, use_cache)
+    if len(face_encodings):
+        return face_encodings[0]
     return None
 
+def encode_face(image, bbox, margin=0.25, persist=False, use_cache=True):
+    """Encoding of the face at an (x, y, w, h) box, from a padded crop only.
+
+    Only the crop is colour-converted and handed to face_recognition, so the
+    cost no longer grows with the full frame size.
+    """
+    crop, face_location = crop_face(image, bbox, margin)
+    return get_face_encoding(crop, [face_location], persist=persist, use_cache=use_cache)
+
+def encode_faces(image, bboxes):
+    """(M, 128) encodings for a list of (x, y, w, h) boxes, in one batch.
+
+    The frame is converted once and all boxes go to face_recognition together.
+    """
+    if not bboxes:
+        return np.empty((0, 128))
+    return get_face_encodings(image, [bbox_to_face_location(bbox) for bbox in bboxes])[1]
+
+@timed('compare_faces')
 def compare_faces(known_encoding, unknown_encoding, tolerance=0.6):
     """Compare two face encodings and return similarity score"""
     if known_encoding is None or unknown_encoding is None:
         return 0.0
+    import face_recognition
         
     # Calculate face distance
     face_distance = face_recognition.face_distance([known_encoding], unknown_encoding)[0]
     # Convert distance to similarity score (0 to 1)
     similarity = 1 - face_distance
     return similarity
+
+
+class GalleryMatcher:
+    """Match a face encoding against every registered encoding in one pass.
+
+    All known encodings are held as a single contiguous (N, 128) float32
+    matrix so a lookup is one batched distance computation instead of a
+    Python loop of np.load + compare_faces calls. A user may own several
+    rows (multi-shot enrollment); rows are grouped per user so the best row
+    of every user is picked with one np.minimum.reduceat.
+
+    precision='float16' or 'int8' keeps the matrix at half or a quarter of
+    the memory; distances are still computed in float32, block by block.
+    """
+    block_rows = 16384
+
+    def __init__(self, encodings=None, users=None, precision='float32', scale=None):
+        self.users = []
+        self.precision = precision
+        self.encodings = np.empty((0, 128), dtype=precision)
+        self.scale = None
+        self.group_starts = None
+        if encodings is not None:
+            self.set_gallery(encodings, users, scale)
+
+    def __len__(self):
+        return len(self.users)
+
+    @staticmethod
+    def _user_key(user):
+        return user['email'] if isinstance(user, dict) else user
+
+    def set_gallery(self, encodings, users, scale=None):
+        """Replace the gallery. encodings may already be in self.precision
+        (e.g. int8 rows with their scale straight from an EncodingStore)."""
+        encodings = np.asarray(encodings).reshape(-1, 128)
+        if encodings.dtype != np.dtype(self.precision) or (self.precision == 'int8' and scale is None):
+            encodings, scale = quantize(encodings, self.precision)
+        self.scale = scale
+        encodings = np.ascontiguousarray(encodings)
+        if len(users) != encodings.shape[0]:
+            raise ValueError("Number of users does not match number of encodings")
+
+        group_of, distinct_users, groups = {}, [], []
+        for user in users:
+            key = self._user_key(user)
+            if key not in group_of:
+                group_of[key] = len(distinct_users)
+                distinct_users.append(user)
+            groups.append(group_of[key])
+
+        self.users = distinct_users
+        if len(distinct_users) == len(groups):
+            # One row per user: no grouping needed
+            self.encodings = encodings
+            self.group_starts = None
+            return
+        order = np.argsort(np.array(groups), kind='stable')
+        self.encodings = np.ascontiguousarray(encodings[order])
+        counts = np.bincount(groups, minlength=len(distinct_users))
+        self.group_starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    @classmethod
+    def from_store(cls, store, user_data=None):
+        """Build a matcher from an EncodingStore, at the store's precision.
+
+        With user_data the matched users are those records (keyed by email);
+        without it the matched users are the store ids themselves.
+        """
+        ids = store.ids()
+        if user_data is None:
+            return cls(np.array(store.raw_encodings()), ids, store.dtype, store.scale) if ids else cls()
+
+        users_by_id = {user['email']: user for user in user_data}
+        keep = [row for row, user_id in enumerate(ids) if user_id in users_by_id]
+        if not keep:
+            return cls()
+        encodings = store.raw_encodings()[keep]
+        return cls(encodings, [users_by_id[ids[row]] for row in keep], store.dtype, store.scale)
+
+    def distances(self, unknown_encoding):
+        """Euclidean distance from unknown_encoding to every known encoding"""
+        unknown = np.asarray(unknown_encoding, dtype=np.float32).reshape(1, 128)
+        if self.precision == 'float32':
+            return np.linalg.norm(self.encodings - unknown, axis=1)
+        distances = np.empty(len(self.encodings), dtype=np.float32)
+        for start in range(0, len(self.encodings), self.block_rows):
+            block = dequantize(self.encodings[start:start + self.block_rows], self.scale)
+            distances[start:start + len(block)] = np.linalg.norm(block - unknown, axis=1)
+        return distances
+
+    def distance_matrix(self, unknown_encodings):
+        """(M, N) Euclidean distances from M unknown encodings to every known encoding"""
+        unknowns = np.asarray(unknown_encodings, dtype=np.float32).reshape(-1, 128)
+        distances = np.empty((len(unknowns), len(self.encodings)), dtype=np.float32)
+        for start in range(0, len(self.encodings), self.block_rows):
+            block = self.encodings[start:start + self.block_rows]
+            if self.precision != 'float32':
+                block = dequantize(block, self.scale)
+            distances[:, start:start + len(block)] = _squared_distances(unknowns, block)
+        return np.sqrt(distances, out=distances)
+
+    def user_distances(self, unknown_encoding):
+        """Distance from unknown_encoding to each user's closest encoding"""
+        distances = self.distances(unknown_encoding)
+        if self.group_starts is None:
+            return distances
+        return np.minimum.reduceat(distances, self.group_starts)
+
+    def _result(self, distances, top_k):
+        k = min(top_k, len(distances))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+
+        top = [(self.users[i], float(1 - distances[i])) for i in nearest]
+        best_user, best_similarity = top[0]
+        return MatchResult(best_user, best_similarity, top, distances)
+
+    @timed('gallery_match')
+    def match(self, unknown_encoding, top_k=1):
+        """Return a MatchResult for unknown_encoding.
+
+        top_k is a list of distinct (user, similarity) sorted best first and
+        distances holds each user's best distance, in self.users order.
+        Similarity uses the same 1 - distance scale as compare_faces.
+        """
+        if unknown_encoding is None or not self.users:
+            return MatchResult(None, 0.0, [], np.empty(0, dtype=np.float32))
+
+        return self._result(self.user_distances(unknown_encoding), top_k)
+
+    @timed('gallery_match_many')
+    def match_many(self, unknown_encodings, top_k=1):
+        """One MatchResult per row of an (M, 128) array of unknown encodings.
+
+        All faces are matched with a single (M, N) distance matrix.
+        """
+        unknowns = np.asarray(unknown_encodings, dtype=np.float32).reshape(-1, 128)
+        if not self.users:
+            return [MatchResult(None, 0.0, [], np.empty(0, dtype=np.float32)) for _ in unknowns]
+        distances = self.distance_matrix(unknowns)
+        if self.group_starts is not None:
+            distances = np.minimum.reduceat(distances, self.group_starts, axis=1)
+        return [self._result(row, top_k) for row in distances]
+
+
+def _squared_distances(queries, points):
+    """(M, N) squared Euclidean distances between two float32 matrices"""
+    distances = (
+        np.einsum('ij,ij->i', queries, queries)[:, None]
+        - 2 * queries @ points.T
+        + np.einsum('ij,ij->i', points, points)[None, :]
+    )
+    return np.maximum(distances, 0, out=distances)
+
+
+class FaceIndex:
+    """Searchable set of (id, encoding) pairs.
+
+    Backends implement add() and search(); save() / load_index() persist
+    them as .npz files so a trained index survives restarts. store_generation
+    is the EncodingStore generation the index was built from, saved with it
+    so open_face_index can tell whether it is still current.
+
+    precision and scale choose the row storage as in GalleryMatcher, so an
+    index over a float16 or int8 store stays at the store's size in memory.
+    """
+    kind = None
+    store_generation = None
+    precision = 'float32'
+    scale = None
+
+    def _set_precision(self, precision, scale):
+        self.precision = precision
+        if precision == 'int8' and scale is None:
+            scale = np.full(128, INT8_CLIP / 127)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+
+    def _stored(self, encodings):
+        """encodings as rows at self.precision; rows already in that dtype are kept as they are"""
+        encodings = np.asarray(encodings).reshape(-1, 128)
+        if encodings.dtype == np.dtype(self.precision):
+            return encodings
+        return quantize(encodings, self.precision, self.scale)[0]
+
+    def _precision_state(self):
+        state = {'precision': self.precision}
+        if self.scale is not None:
+            state['scale'] = self.scale
+        return state
+
+    @staticmethod
+    def _precision_from_state(state):
+        if 'precision' not in state.files:
+            return 'float32', None
+        return str(state['precision']), state['scale'] if 'scale' in state.files else None
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def add(self, ids, encodings):
+        raise NotImplementedError
+
+    def remove(self, ids):
+        """Drop every encoding stored under one of ids"""
+        raise NotImplementedError
+
+    def copy(self):
+        """Index that can be changed without affecting this one.
+
+        Encoding arrays are shared: add() and remove() replace them rather
+        than writing into them.
+        """
+        raise NotImplementedError
+
+    def search(self, encoding, top_k=1):
+        """[(id, distance), ...] for the top_k nearest encodings, nearest first"""
+        raise NotImplementedError
+
+    def search_many(self, encodings, top_k=1):
+        """search() for every row of an (M, 128) array"""
+        return [self.search(encoding, top_k) for encoding in np.asarray(encodings).reshape(-1, 128)]
+
+    def _state(self):
+        raise NotImplementedError
+
+    def save(self, path):
+        extra = {} if self.store_generation is None else {'store_generation': np.uint64(self.store_generation)}
+        _save_npz(path, kind=self.kind, **extra, **self._state())
+
+
+class ExactIndex(FaceIndex):
+    """Brute-force search over every encoding (the reference backend)"""
+    kind = 'exact'
+
+    def __init__(self, ids=(), encodings=None, precision='float32', scale=None):
+        self.ids = list(ids)
+        self._set_precision(precision, scale)
+        self.encodings = np.empty((0, 128), dtype=precision)
+        if encodings is not None:
+            # A copy, never a view into a memory-mapped store
+            self.encodings = np.array(self._stored(encodings), order='C')
+        self._matcher = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, ids, encodings):
+        self.ids.extend(ids)
+        self.encodings = np.vstack([self.encodings, self._stored(encodings)])
+        self._matcher = None
+
+    def remove(self, ids):
+        ids = set(ids)
+        keep = [row for row, user_id in enumerate(self.ids) if user_id not in ids]
+        self.ids = [self.ids[row] for row in keep]
+        self.encodings = self.encodings[keep]
+        self._matcher = None
+
+    def copy(self):
+        index = ExactIndex(self.ids, precision=self.precision, scale=self.scale)
+        index.encodings = self.encodings
+        return index
+
+    def _matcher_for_search(self):
+        if self._matcher is None:
+            self._matcher = GalleryMatcher(self.encodings, self.ids, self.precision, self.scale)
+        return self._matcher
+
+    @timed('index_search.exact')
+    def search(self, encoding, top_k=1):
+        result = self._matcher_for_search().match(encoding, top_k)
+        return [(user_id, 1 - similarity) for user_id, similarity in result.top_k]
+
+    @timed('index_search_many.exact')
+    def search_many(self, encodings, top_k=1):
+        results = self._matcher_for_search().match_many(encodings, top_k)
+        return [[(user_id, 1 - similarity) for user_id, similarity in result.top_k] for result in results]
+
+    def _state(self):
+        return {'ids': np.array(self.ids, dtype=str), 'encodings': self.encodings, **self._precision_state()}
+
+    @classmethod
+    def _from_state(cls, state):
+        precision, scale = cls._precision_from_state(state)
+        return cls(state['ids'].tolist(), state['encodings'], precision, scale)
+
+
+class IVFIndex(FaceIndex):
+    """Approximate search with an inverted file over a k-means coarse quantizer.
+
+    Encodings are bucketed by their nearest centroid; a query only scans the
+    n_probe buckets whose centroids are closest to it. New encodings are
+    assigned to the existing centroids, so enrolling someone does not need
+    a retrain.
+    """
+    kind = 'ivf'
+
+    def __init__(self, centroids, n_probe=8, precision='float32', scale=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.n_probe = n_probe
+        self._set_precision(precision, scale)
+        self.list_ids = [[] for _ in range(len(self.centroids))]
+        self.list_encodings = [np.empty((0, 128), dtype=precision) for _ in range(len(self.centroids))]
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.list_ids)
+
+    @classmethod
+    def train(cls, encodings, n_lists=None, n_probe=8, iterations=15, sample_size=50000, seed=0,
+              precision='float32', scale=None):
+        """Fit the coarse quantizer with k-means on (a sample of) float encodings"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        rng = np.random.default_rng(seed)
+        if len(encodings) > sample_size:
+            encodings = encodings[rng.choice(len(encodings), sample_size, replace=False)]
+        n_lists = min(n_lists or max(1, int(np.sqrt(len(encodings)))), len(encodings))
+
+        centroids = encodings[rng.choice(len(encodings), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = cls._nearest(encodings, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, encodings)
+            counts = np.bincount(assignment, minlength=n_lists)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        return cls(centroids, n_probe=n_probe, precision=precision, scale=scale)
+
+    @staticmethod
+    def _nearest(encodings, centroids, chunk=8192):
+        assignment = np.empty(len(encodings), dtype=np.int64)
+        for start in range(0, len(encodings), chunk):
+            block = encodings[start:start + chunk]
+            assignment[start:start + chunk] = _squared_distances(block, centroids).argmin(axis=1)
+        return assignment
+
+    def add(self, ids, encodings):
+        stored = self._stored(encodings)
+        ids = list(ids)
+        assignment = self._nearest(dequantize(stored, self.scale), self.centroids)
+        for list_no in np.unique(assignment):
+            rows = np.flatnonzero(assignment == list_no)
+            self.list_ids[list_no].extend(ids[row] for row in rows)
+            self.list_encodings[list_no] = np.vstack([self.list_encodings[list_no], stored[rows]])
+
+    def remove(self, ids):
+        ids = set(ids)
+        for list_no, list_ids in enumerate(self.list_ids):
+            keep = [row for row, user_id in enumerate(list_ids) if user_id not in ids]
+            if len(keep) < len(list_ids):
+                self.list_ids[list_no] = [list_ids[row] for row in keep]
+                self.list_encodings[list_no] = self.list_encodings[list_no][keep]
+
+    def copy(self):
+        index = IVFIndex(self.centroids, n_probe=self.n_probe, precision=self.precision, scale=self.scale)
+        index.list_ids = [list(list_ids) for list_ids in self.list_ids]
+        index.list_encodings = list(self.list_encodings)
+        return index
+
+    @timed('index_search.ivf')
+    def search(self, encoding, top_k=1):
+        query = np.asarray(encoding, dtype=np.float32).reshape(1, 128)
+        n_probe = min(self.n_probe, len(self.centroids))
+        probe = np.argpartition(_squared_distances(query, self.centroids)[0], n_probe - 1)[:n_probe]
+
+        candidate_ids = [user_id for list_no in probe for user_id in self.list_ids[list_no]]
+        if not candidate_ids:
+            return []
+        candidates = np.concatenate([self.list_encodings[list_no] for list_no in probe])
+        return ExactIndex(candidate_ids, candidates, self.precision, self.scale).search(query, top_k)
+
+    def _state(self):
+        ids = [user_id for list_ids in self.list_ids for user_id in list_ids]
+        return {
+            'centroids': self.centroids,
+            'n_probe': self.n_probe,
+            'ids': np.array(ids, dtype=str),
+            'encodings': np.concatenate(self.list_encodings),
+            'list_sizes': np.array([len(list_ids) for list_ids in self.list_ids]),
+            **self._precision_state(),
+        }
+
+    @classmethod
+    def _from_state(cls, state):
+        precision, scale = cls._precision_from_state(state)
+        index = cls(state['centroids'], n_probe=int(state['n_probe']), precision=precision, scale=scale)
+        ids = state['ids'].tolist()
+        offsets = np.concatenate([[0], np.cumsum(state['list_sizes'])])
+        for list_no in range(len(index.centroids)):
+            start, end = offsets[list_no], offsets[list_no + 1]
+            index.list_ids[list_no] = ids[start:end]
+            index.list_encodings[list_no] = np.ascontiguousarray(state['encodings'][start:end])
+        return index
+
+
+INDEX_BACKENDS = {backend.kind: backend for backend in (ExactIndex, IVFIndex)}
+
+
+def load_index(path):
+    """Load an index written by FaceIndex.save"""
+    with np.load(path) as state:
+        index = INDEX_BACKENDS[str(state['kind'])]._from_state(state)
+        if 'store_generation' in state.files:
+            index.store_generation = int(state['store_generation'])
+        return index
+
+
+def build_index(ids, encodings, ivf_min_size=20000, precision='float32', scale=None):
+    """Exact index for small galleries, IVF once brute force gets expensive.
+
+    encodings are float, or rows already stored at precision (with scale for int8).
+    """
+    encodings = np.asarray(encodings).reshape(-1, 128)
+    if len(encodings) >= ivf_min_size:
+        stored = precision != 'float32' and encodings.dtype == np.dtype(precision)
+        index = IVFIndex.train(dequantize(encodings, scale) if stored else encodings, precision=precision, scale=scale)
+    else:
+        index = ExactIndex(precision=precision, scale=scale)
+    index.add(list(ids), encodings)
+    return index
+
+
+def build_store_index(store):
+    """build_index over every row of an EncodingStore at its precision, tagged with its generation"""
+    index = build_index(store.ids(), store.raw_encodings(), precision=store.dtype, scale=store.scale)
+    index.store_generation = store.generation
+    return index
+
+
+@timed('open_face_index')
+def open_face_index(store, path=FACE_INDEX_PATH):
+    """Index over an EncodingStore, loaded from path when it was saved for the store's current rows"""
+    if os.path.exists(path):
+        try:
+            index = load_index(path)
+            if index.store_generation == store.generation and len(index) == len(store):
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Rebuilding face index: {e}")
+    index = build_store_index(store)
+    index.save(path)
+    return index
+
+
+def evaluate_index(index, reference, queries, top_k=1):
+    """Recall@top_k and mean latency of index against a reference (exact) index"""
+    hits, latencies, reference_latencies = 0, [], []
+    for query in queries:
+        start = time.perf_counter()
+        expected = {user_id for user_id, _ in reference.search(query, top_k)}
+        reference_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        found = {user_id for user_id, _ in index.search(query, top_k)}
+        latencies.append(time.perf_counter() - start)
+        hits += len(expected & found)
+    return {
+        'recall': hits / max(1, len(queries) * top_k),
+        'latency_ms': 1000 * float(np.mean(latencies)),
+        'reference_latency_ms': 1000 * float(np.mean(reference_latencies)),
+    }
@@ -0,0 +1,152 @@
+# gallery.py
+import os
+import time
+import threading
+from collections import Counter
+import numpy as np
+
+from encoding_store import ENCODING_STORE_PATH, open_encoding_store, store_lock
+from face_utils import FACE_INDEX_PATH, build_store_index, open_face_index
+from metrics import span
+
+
+class FaceGallery:
+    """Process-wide face index that follows the encoding store.
+
+    The store and its index are loaded once. Readers search snapshot(), an
+    index that is never modified once published, so they take no lock.
+    Every poll_interval seconds a reader checks the store file's inode,
+    mtime and size. When they changed, the new rows are applied to a copy
+    of the current index: appended rows are added, and ids that disappeared
+    in a rewrite are removed. Then the copy is swapped in. Only a change
+    that cannot be expressed that way rebuilds the index.
+
+    Enrollment goes through add(), which saves the index to index_path on a
+    timer save_delay seconds later, once for a burst of enrollments, instead
+    of loading and rewriting the file on every one.
+    """
+    def __init__(self, path=ENCODING_STORE_PATH, index_path=FACE_INDEX_PATH, poll_interval=1.0, save_delay=2.0):
+        self.path = path
+        self.index_path = index_path
+        self.poll_interval = poll_interval
+        self.save_delay = save_delay
+        self.reloads = 0
+        self._snapshot = None
+        self._ids = []
+        self._signature = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+        self._save_timer = None
+        self._save_lock = threading.Lock()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def snapshot(self):
+        """Current FaceIndex; polls the store for changes at most every poll_interval"""
+        now = time.monotonic()
+        if self._snapshot is None or now >= self._next_poll:
+            self._next_poll = now + self.poll_interval
+            # Only the first load waits; later readers keep the old snapshot while another thread refreshes
+            self.refresh(wait=self._snapshot is None)
+        return self._snapshot
+
+    def search(self, encoding, top_k=1):
+        return self.snapshot().search(encoding, top_k)
+
+    def refresh(self, wait=True):
+        """Bring the snapshot up to date with the store. Returns True if it changed."""
+        if not self._lock.acquire(blocking=wait):
+            return False
+        try:
+            signature = self._file_signature()
+            if self._snapshot is not None and signature == self._signature:
+                return False
+            with span('gallery.reload'), store_lock(self.path):
+                # Under the store lock so the index matches the generation it is tagged with
+                store = open_encoding_store(self.path)
+                try:
+                    ids = store.ids()
+                    if self._snapshot is None:
+                        index = open_face_index(store, self.index_path)
+                    else:
+                        index = self._apply_changes(store, ids)
+                        index.store_generation = store.generation
+                finally:
+                    store.close()
+            self._ids, self._signature, self._snapshot = ids, signature, index
+            self.reloads += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def _apply_changes(self, store, ids):
+        """Copy of the current index with the store's changes since the last load applied"""
+        old_ids = self._ids
+        if self._snapshot.precision != store.dtype or not np.array_equal(self._snapshot.scale, store.scale):
+            print("Encoding store precision changed, rebuilding the face index")
+            return build_store_index(store)
+        index = self._snapshot.copy()
+        if ids[:len(old_ids)] == old_ids:
+            # Enrollment only ever appends rows
+            added = list(range(len(old_ids), len(ids)))
+        else:
+            # The store was rewritten (e.g. compacted): remove vanished ids, add new ones
+            old_set, new_set = set(old_ids), set(ids)
+            removed = old_set - new_set
+            if removed:
+                index.remove(removed)
+            kept = Counter(user_id for user_id in old_ids if user_id not in removed)
+            if kept != Counter(user_id for user_id in ids if user_id in old_set):
+                print("Face gallery changed beyond adds and removes, rebuilding the index")
+                return build_store_index(store)
+            added = [row for row, user_id in enumerate(ids) if user_id not in old_set]
+        if added:
+            index.add([ids[row] for row in added], store.raw_encodings()[added])
+        return index
+
+    def add(self, ids, encodings):
+        """Append encodings to the store, publish them and save the index soon after"""
+        store = open_encoding_store(self.path)
+        try:
+            store.extend(ids, encodings)
+        finally:
+            store.close()
+        self.refresh()  # Sign-in sees the new encodings straight away
+        self.schedule_save()
+        return self.path
+
+    def schedule_save(self):
+        """Save the snapshot save_delay seconds from now, unless a save is already due"""
+        with self._save_lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.save_delay, self.save)
+                self._save_timer.start()
+
+    def save(self):
+        """Write the current snapshot to index_path for the next start to load"""
+        with self._save_lock:
+            self._save_timer = None
+        self.refresh()
+        with self._lock, span('gallery.save'):
+            try:
+                self._snapshot.save(self.index_path)
+            except OSError as e:
+                print(f"Error saving face index: {e}")
+
+
+_gallery = None
+_gallery_lock = threading.Lock()
+
+
+def get_gallery():
+    """Process-wide FaceGallery"""
+    global _gallery
+    with _gallery_lock:
+        if _gallery is None:
+            _gallery = FaceGallery()
+        return _gallery
@@ -0,0 +1,265 @@
+# inference_server.py
+"""Face detection, encoding and matching in a pool of worker processes.
+
+dlib and MediaPipe hold the GIL for long stretches, so running them on the
+UI process's threads stalls rendering. With FACE_INFERENCE_WORKERS=n the
+app starts n worker processes instead: frames are copied into shared memory
+slots and only boxes, ids and scores come back over a multiprocessing
+queue. Without the variable everything runs in-process through
+LocalInference, which has the same methods.
+"""
+import os
+import queue
+import atexit
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import Future
+from collections import namedtuple
+import numpy as np
+
+from face_utils import encode_face, get_face_detector, warm_up_models
+from gallery import get_gallery
+from metrics import metrics, timed
+
+Recognition = namedtuple('Recognition', ['box', 'encoded', 'user', 'similarity'])
+
+
+@timed('inference.recognize')
+def recognize(frame, box=None):
+    """Detect (unless box is given), encode and match the face in frame.
+
+    encoded is False when no encoding could be computed; user is None when
+    the gallery is empty. similarity uses the 1 - distance scale.
+    """
+    if box is None:
+        box = get_face_detector().detect_face(frame)
+        if not box:
+            return Recognition(None, False, None, 0.0)
+    encoding = encode_face(frame, box)
+    if encoding is None:
+        return Recognition(box, False, None, 0.0)
+    nearest = get_gallery().search(encoding)
+    if not nearest:
+        return Recognition(box, True, None, 0.0)
+    user, distance = nearest[0]
+    return Recognition(box, True, user, float(1 - distance))
+
+
+class LocalInference:
+    """Runs the models in this process; same interface as InferenceClient"""
+    def detect_face(self, frame):
+        return get_face_detector().detect_face(frame)
+
+    def encode_face(self, frame, box):
+        return encode_face(frame, box)
+
+    def recognize(self, frame, box=None):
+        return recognize(frame, box)
+
+
+def _serve(worker, requests, results):
+    """Worker process: answer requests until a None arrives.
+
+    With FACE_METRICS set, the spans recorded here travel back with each
+    result and are merged into the parent's metrics, which it exports.
+    """
+    local = LocalInference()
+    metrics.start_forwarding()
+    try:
+        warm_up_models()
+        get_gallery().snapshot()
+    except Exception as e:
+        # The client sees the process exit and fails this worker's requests
+        results.put((worker, None, None, f"Inference worker {worker} failed to start: {type(e).__name__}: {e}",
+                     metrics.drain()))
+        return
+    attached = {}
+    try:
+        for request_id, slot_name, shape, operation, args in iter(requests.get, None):
+            frame = None
+            try:
+                if slot_name not in attached:
+                    attached[slot_name] = shared_memory.SharedMemory(name=slot_name)
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=attached[slot_name].buf)
+                result = getattr(local, operation)(frame, *args)
+                results.put((worker, request_id, result, None, metrics.drain()))
+            except Exception as e:
+                results.put((worker, request_id, None, f"{type(e).__name__}: {e}", metrics.drain()))
+            finally:
+                del frame
+    finally:
+        for memory in attached.values():
+            try:
+                memory.close()
+            except BufferError:
+                pass
+
+
+class InferenceClient:
+    """Send frames to a pool of inference worker processes.
+
+    Each request copies the frame into one of `slots` shared memory buffers
+    of max_frame_bytes. A caller waits for a free slot, which bounds the
+    frames in flight, and the slot is released when the answer arrives.
+    Requests go to the live worker with the fewest in flight. When a worker
+    process dies, its requests fail straight away instead of timing out.
+    """
+    poll_interval = 0.5  # seconds between checks that the workers are alive
+
+    def __init__(self, workers=None, slots=None, max_frame_bytes=1280 * 720 * 3, timeout=10.0):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.slot_count = slots or 2 * self.workers
+        self.max_frame_bytes = max_frame_bytes
+        self.timeout = timeout
+        self._processes = []
+        self._queues = []
+        self._slots = []
+        self._pending = {}  # request id -> (future, slot, worker)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        # Load (and if needed rebuild and save) the index here once, so the workers only read it
+        get_gallery().snapshot()
+        # spawn: forking a process that already runs Flet and camera threads is unsafe
+        context = multiprocessing.get_context('spawn')
+        self._results = context.Queue()
+        self._slots = [shared_memory.SharedMemory(create=True, size=self.max_frame_bytes)
+                       for _ in range(self.slot_count)]
+        self._free = queue.Queue()
+        for slot in range(self.slot_count):
+            self._free.put(slot)
+        self._queues = [context.Queue() for _ in range(self.workers)]
+        self._processes = [
+            context.Process(target=_serve, args=(worker, self._queues[worker], self._results), daemon=True)
+            for worker in range(self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _collect(self):
+        """Hand results back to their futures and free their slots"""
+        while not self._stopped.is_set():
+            try:
+                worker, request_id, result, error, samples = self._results.get(timeout=self.poll_interval)
+            except queue.Empty:
+                self._reap()
+                continue
+            metrics.merge(samples)
+            if request_id is None:
+                print(error)
+                continue
+            with self._lock:
+                pending = self._pending.pop(request_id, None)
+            if pending is None:
+                continue  # already failed by _reap
+            future, slot, _ = pending
+            self._free.put(slot)
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(result)
+            self._reap()
+
+    def _reap(self):
+        """Fail the requests of worker processes that have died"""
+        failed = []
+        with self._lock:
+            for request_id, (future, slot, worker) in list(self._pending.items()):
+                if not self._processes[worker].is_alive():
+                    del self._pending[request_id]
+                    failed.append((future, slot, worker))
+        for future, slot, worker in failed:
+            # The dead process no longer reads the slot, so it can be reused
+            self._free.put(slot)
+            future.set_exception(RuntimeError(
+                f"Inference worker {worker} exited with code {self._processes[worker].exitcode}"))
+
+    def _pick_worker(self):
+        """Live worker with the fewest requests in flight; call with the lock held"""
+        alive = [worker for worker, process in enumerate(self._processes) if process.is_alive()]
+        if not alive:
+            raise RuntimeError("No inference worker is running")
+        load = {worker: 0 for worker in alive}
+        for _, _, worker in self._pending.values():
+            if worker in load:
+                load[worker] += 1
+        return min(alive, key=load.get)
+
+    def submit(self, operation, frame, *args):
+        """Queue operation (a LocalInference method name) on frame; returns a Future"""
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.nbytes > self.max_frame_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes exceeds the {self.max_frame_bytes} byte slots")
+        try:
+            slot = self._free.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError("No free inference slot") from None
+        memory = self._slots[slot]
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=memory.buf)[...] = frame
+
+        future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            try:
+                worker = self._pick_worker()
+            except RuntimeError:
+                self._free.put(slot)
+                raise
+            self._pending[request_id] = (future, slot, worker)
+        self._queues[worker].put((request_id, memory.name, frame.shape, operation, args))
+        return future
+
+    def call(self, operation, frame, *args):
+        return self.submit(operation, frame, *args).result(timeout=self.timeout)
+
+    def detect_face(self, frame):
+        return self.call('detect_face', frame)
+
+    def encode_face(self, frame, box):
+        return self.call('encode_face', frame, box)
+
+    def recognize(self, frame, box=None):
+        return self.call('recognize', frame, box)
+
+    def stop(self):
+        for requests in self._queues:
+            requests.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._stopped.set()
+        self._collector.join()
+        self._reap()  # every worker has exited, so this fails anything still pending
+        self._processes = []
+        self._queues = []
+        for memory in self._slots:
+            memory.close()
+            memory.unlink()
+        self._slots = []
+
+
+_inference = None
+_inference_lock = threading.Lock()
+
+
+def get_inference():
+    """InferenceClient with FACE_INFERENCE_WORKERS processes if set, else LocalInference"""
+    global _inference
+    with _inference_lock:
+        if _inference is None:
+            workers = int(os.environ.get('FACE_INFERENCE_WORKERS', '0') or 0)
+            if workers > 0:
+                client = InferenceClient(workers)
+                client.start()
+                atexit.register(client.stop)
+                _inference = client
+            else:
+                _inference = LocalInference()
+        return _inference
@@ -1,21 +1,56 @@
 import time
+_process_start = time.perf_counter()
+
+import threading
 import flet as ft
 from signup import SignUpPage
-from signin import SignInPage
 from landingpage import LandingPage
-from register_face import RegisterFace
-from user import User
-from display_recognized_user import DisplayRecognizedUser
+from metrics import metrics, start_exporter
+
+# The sign-in, face registration and user pages pull in OpenCV, MediaPipe and
+# the dlib models, so they are imported when first visited (or by warm_up)
+# and the landing page can render without waiting for them.
+_first_paint_recorded = False
+
+def warm_up():
+    """Import the recognition stack in the background while the landing page is shown"""
+    start = time.perf_counter()
+    try:
+        import face_recognition  # Loads the dlib models
+        import mediapipe
+        import signin, register_face, user, display_recognized_user
+        from face_utils import warm_up_models
+        from gallery import get_gallery
+        from inference_server import LocalInference, get_inference
+        # With worker processes the models load there; the UI process only needs the gallery
+        if isinstance(get_inference(), LocalInference):
+            warm_up_models()
+        get_gallery().snapshot()  # Load the encodings and index before the first sign-in
+    except (ImportError, RuntimeError, OSError, ValueError) as e:
+        print(f"Error warming up recognition models: {e}")
+        return
+    metrics.record('startup.warm_up', time.perf_counter() - start)
 
 def main(page: ft.Page):
+    global _first_paint_recorded
     page.title = "Flet Face Recognition Application"
     page.theme_mode = ft.ThemeMode.DARK
+    start_exporter()
 
     landing_page_instance = LandingPage(page)
-    signin_page_instance = SignInPage(page)
     signup_page_instance = SignUpPage(page)
-    register_face_instance = RegisterFace(page)
-    user_instance = User(page)
+    pages = {}
+
+    def get_page(route):
+        """Build the page for route on first use and reuse it afterwards"""
+        if route not in pages:
+            if route == "/signin":
+                from signin import SignInPage
+                pages[route] = SignInPage(page)
+            elif route == "/register_face":
+                from register_face import RegisterFace
+                pages[route] = RegisterFace(page)
+        return pages[route]
 
     def show_snackbar(message):
         """Display a snackbar with a message using the new Flet method."""
@@ -69,7 +104,7 @@ def main(page: ft.Page):
                             title=ft.Text("Sign In"),
                             bgcolor=ft.colors.SURFACE_VARIANT
                         ),
-                        signin_page_instance
+                        get_page("/signin")
                     ]
                 )
             )
@@ -110,11 +145,12 @@ def main(page: ft.Page):
                                 title=ft.Text("Register face"),
                                 bgcolor=ft.colors.SURFACE_VARIANT
                             ),
-                            register_face_instance,
+                            get_page("/register_face"),
                         ]
                     )
                 )
         elif page.route == "/user":
+            from user import User
             page.views.append(
                 ft.View(
                     route="/user",
@@ -129,7 +165,7 @@ def main(page: ft.Page):
                             title=ft.Text("Registered User"),
                             bgcolor=ft.colors.SURFACE_VARIANT
                         ),
-                        user_instance,
+                        User(page),  # Built per visit so it shows the user who just registered
                     ]
                 )
             )
@@ -137,6 +173,7 @@ def main(page: ft.Page):
             # Extract user data from the route
             user_data = page.client_storage.get("recognized_user_data")
             if user_data:
+                from display_recognized_user import DisplayRecognizedUser
                 display_recognized_user_instance = DisplayRecognizedUser(page, user_data)
                 page.views.append(
                     ft.View(
@@ -173,6 +210,10 @@ def main(page: ft.Page):
     page.on_route_change = route_change
     page.on_view_pop = view_pop
     page.go(page.route)
+    if not _first_paint_recorded:
+        _first_paint_recorded = True
+        metrics.record('startup.first_paint', time.perf_counter() - _process_start)
 
 if __name__ == '__main__':
+    threading.Thread(target=warm_up, daemon=True).start()
     ft.app(target=main, assets_dir='assets')
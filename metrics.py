@@ -0,0 +1,211 @@
+# metrics.py
+import os
+import json
+import time
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PATH = os.path.join('application_data', 'metrics.json')
+
+
+class RollingHistogram:
+    """Durations of the most recent `window` calls plus lifetime totals"""
+    def __init__(self, window=1024):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def snapshot(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {'count': self.count}
+
+        def percentile(q):
+            return 1000 * ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+        return {
+            'count': self.count,
+            'total_s': self.total,
+            'mean_ms': 1000 * sum(ordered) / len(ordered),
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': 1000 * ordered[-1],
+        }
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Metrics:
+    """Named timing spans over monotonic clocks, kept as rolling histograms.
+
+    When disabled, span() hands back a shared no-op context manager and
+    timed() functions cost one attribute check, so the instrumentation can
+    stay wired into the hot path. Enable with FACE_METRICS=1.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.outbox = None
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = RollingHistogram()
+            histogram.record(seconds)
+            if self.outbox is not None:
+                self.outbox.append((name, seconds))
+
+    def start_forwarding(self):
+        """Also keep every sample for drain(), so a worker process can send them to its parent"""
+        if self.enabled:
+            with self.lock:
+                self.outbox = []
+
+    def drain(self):
+        """[(name, seconds)] recorded since the last drain (empty unless forwarding)"""
+        with self.lock:
+            if not self.outbox:
+                return []
+            samples, self.outbox = self.outbox, []
+            return samples
+
+    def merge(self, samples):
+        """Record samples drained from another process"""
+        for name, seconds in samples:
+            self.record(name, seconds)
+
+    def span(self, name):
+        """Context manager timing its body under name"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator timing every call of the wrapped function under name"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self.lock:
+            return {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())}
+
+    def write_snapshot(self, path=METRICS_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'timestamp': time.time(), 'spans': self.snapshot()}, f, indent=4)
+        os.replace(tmp_path, path)
+
+    def prometheus_text(self):
+        """Snapshot in the Prometheus text exposition format"""
+        lines = [
+            '# HELP face_span_seconds Duration of instrumented recognition stages',
+            '# TYPE face_span_seconds summary',
+        ]
+        for name, stats in self.snapshot().items():
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            for quantile in ('p50', 'p95', 'p99'):
+                if f'{quantile}_ms' in stats:
+                    lines.append(
+                        f'face_span_seconds{{span="{label}",quantile="0.{quantile[1:]}"}} '
+                        f'{stats[f"{quantile}_ms"] / 1000:.6f}'
+                    )
+            lines.append(f'face_span_seconds_sum{{span="{label}"}} {stats.get("total_s", 0.0):.6f}')
+            lines.append(f'face_span_seconds_count{{span="{label}"}} {stats["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve /metrics (Prometheus text) and /metrics.json locally on a daemon thread"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = metrics.prometheus_text(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = json.dumps(metrics.snapshot()), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+metrics = Metrics(enabled=os.environ.get('FACE_METRICS', '') not in ('', '0'))
+span = metrics.span
+timed = metrics.timed
+_exporter_started = False
+
+
+def start_exporter(interval=10.0, path=METRICS_PATH):
+    """Export metrics when enabled: a JSON snapshot file every interval seconds,
+    plus a local HTTP endpoint if FACE_METRICS_PORT is set. Safe to call per session."""
+    global _exporter_started
+    if not metrics.enabled or _exporter_started:
+        return
+    _exporter_started = True
+    port = os.environ.get('FACE_METRICS_PORT')
+    if port:
+        metrics.serve(int(port))
+        print(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+
+    def export():
+        while True:
+            time.sleep(interval)
+            try:
+                metrics.write_snapshot(path)
+            except OSError as e:
+                print(f"Error writing metrics: {e}")
+
+    threading.Thread(target=export, daemon=True).start()
@@ -0,0 +1,100 @@
+# preview.py
+import time
+import base64
+import threading
+import cv2
+from metrics import metrics
+
+
+class PreviewStreamer:
+    """Push camera frames to an ft.Image as cheaply as the UI can take them.
+
+    Frames are JPEG encoded (much faster than PNG) with a quality knob. The
+    loop paces itself on the measured encode + update round trip instead of
+    a fixed sleep, and always takes the newest frame from the camera, so
+    frames that arrive while the UI is busy are dropped rather than queued.
+    on_frame, if given, receives every displayed (cropped) frame.
+    """
+    def __init__(self, camera, control, image, crop=None, quality=70, max_fps=30, on_frame=None):
+        self.camera = camera
+        self.control = control
+        self.image = image
+        self.crop = crop
+        self.on_frame = on_frame
+        self.quality = quality
+        self.max_fps = max_fps
+        self.running = False
+        self.thread = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames = 0
+        self.dropped = 0
+        self.cpu_time = 0.0
+        self.round_trip = 0.0
+        self.started_at = time.perf_counter()
+
+    def start(self):
+        self.running = True
+        self.reset_stats()
+        # A loop that is still winding down from stop() simply carries on
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.frames:
+            print(f"Preview: {self.stats()}")
+
+    def encode(self, frame):
+        _, im_arr = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return base64.b64encode(im_arr).decode("utf-8")
+
+    def _run(self):
+        min_interval = 1.0 / self.max_fps
+        smoothed_round_trip = min_interval
+        frame_id = 0
+        while self.running:
+            new_frame_id, frame = self.camera.wait_for_frame(frame_id)
+            if frame is None:
+                continue
+            if frame_id:
+                self.dropped += new_frame_id - frame_id - 1
+            frame_id = new_frame_id
+
+            start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                if self.crop is not None:
+                    frame = self.crop(frame)
+                self.image.src_base64 = self.encode(frame)
+                self.control.update()
+                if self.on_frame is not None:
+                    self.on_frame(frame)
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+
+            cpu = time.thread_time() - cpu_start
+            self.frames += 1
+            self.cpu_time += cpu
+            self.round_trip += elapsed
+            metrics.record('preview.frame', elapsed)
+            metrics.record('preview.frame_cpu', cpu)
+
+            # Pace on the recent round trip so a slow UI gets fewer frames
+            smoothed_round_trip = 0.8 * smoothed_round_trip + 0.2 * elapsed
+            time.sleep(max(0.0, max(min_interval, smoothed_round_trip) - elapsed))
+
+    def stats(self):
+        """Preview throughput and per-frame cost since start()"""
+        frames = max(1, self.frames)
+        return {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'fps': self.frames / max(1e-9, time.perf_counter() - self.started_at),
+            'cpu_ms_per_frame': 1000 * self.cpu_time / frames,
+            'round_trip_ms': 1000 * self.round_trip / frames,
+        }
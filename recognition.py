@@ -0,0 +1,134 @@
+# recognition.py
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from face_utils import box_iou
+
+
+class RecognitionWorker:
+    """Runs recognition jobs off the Flet event handler thread.
+
+    Jobs go to a single background thread and come back as futures. At most
+    max_pending jobs are queued or running; further submissions are refused
+    so repeated clicks cannot pile up work. Each job receives a
+    threading.Event it should check between stages, set by cancel().
+    """
+    def __init__(self, max_pending=1):
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recognition')
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, on_done=None):
+        """Queue fn(*args, cancelled=event); return its future or None if full.
+
+        on_done(result) is called from the worker thread when the job
+        finishes without being cancelled. Exceptions are printed.
+        """
+        with self.lock:
+            if len(self.pending) >= self.max_pending:
+                return None
+            cancelled = threading.Event()
+            future = self.executor.submit(fn, *args, cancelled=cancelled)
+            self.pending[future] = cancelled
+
+        def finished(future):
+            with self.lock:
+                self.pending.pop(future, None)
+            if future.cancelled() or cancelled.is_set():
+                return
+            error = future.exception()
+            if error is not None:
+                print(f"Error during recognition: {error}")
+                return
+            if on_done is not None:
+                on_done(future.result())
+
+        future.add_done_callback(finished)
+        return future
+
+    def cancel(self):
+        """Cancel queued jobs and ask running ones to stop"""
+        with self.lock:
+            jobs = list(self.pending.items())
+        # future.cancel() runs the done callback inline, which takes the lock
+        for future, cancelled in jobs:
+            cancelled.set()
+            future.cancel()
+
+
+class ContinuousRecognizer:
+    """Hands-free recognition driven by the preview stream.
+
+    feed() is called for every preview frame. Every detect_every-th frame is
+    handed to the worker for a cheap detection; the expensive encode + match
+    (identify) only runs when the face is large enough, has stayed in place
+    since the previous detection and encode_interval seconds have passed.
+    on_match(user_id) fires once the same user wins `agreement` identify
+    calls in a row.
+    """
+    def __init__(self, worker, detect_face, identify, on_match, detect_every=5,
+                 encode_interval=0.5, min_face_size=80, min_iou=0.6, agreement=3):
+        self.worker = worker
+        self.detect_face = detect_face
+        self.identify = identify
+        self.on_match = on_match
+        self.detect_every = detect_every
+        self.encode_interval = encode_interval
+        self.min_face_size = min_face_size
+        self.min_iou = min_iou
+        self.agreement = agreement
+        self.frame_count = 0
+        self.reset()
+
+    def reset(self):
+        self.last_box = None
+        self.last_encode = 0.0
+        self.candidate = None
+        self.votes = 0
+
+    def feed(self, frame):
+        self.frame_count += 1
+        if self.frame_count % self.detect_every:
+            return
+        # Dropped when the worker is busy; the next sampled frame is fresher anyway
+        self.worker.submit(self.step, frame)
+
+    def step(self, frame, cancelled):
+        box = self.detect_face(frame)
+        if not box or min(box[2], box[3]) < self.min_face_size:
+            self.reset()
+            return
+
+        stable = self.last_box is not None and box_iou(self.last_box, box) >= self.min_iou
+        self.last_box = box
+        now = time.monotonic()
+        if not stable or now - self.last_encode < self.encode_interval or cancelled.is_set():
+            return
+
+        self.last_encode = now
+        user_id = self.identify(frame, box)
+        if user_id is None:
+            self.candidate, self.votes = None, 0
+            return
+        if user_id == self.candidate:
+            self.votes += 1
+        else:
+            self.candidate, self.votes = user_id, 1
+
+        if self.votes >= self.agreement and not cancelled.is_set():
+            self.reset()
+            self.on_match(user_id)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_recognition_worker():
+    """Process-wide RecognitionWorker"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = RecognitionWorker()
+        return _worker
@@ -1,29 +1,45 @@
 # register_face.py
 import os
-import json
-import base64
 import cv2
 import time
-import threading
 import flet as ft
 import numpy as np
 from datetime import datetime
-from face_utils import FaceDetector, get_face_encoding
+from face_utils import DUPLICATE_DISTANCE, MATCH_DISTANCE, GalleryMatcher, sharpness
+from encoding_store import open_encoding_store
+from user_store import get_user_repository
+from camera import get_camera
+from preview import PreviewStreamer
+from gallery import get_gallery
+from inference_server import get_inference
+from thumbnails import get_thumbnail_cache
+from metrics import timed
 
 class RegisterFace(ft.UserControl):
+    # Multi-shot enrollment settings
+    burst_seconds = 2.0      # how long to sample the camera
+    burst_interval = 0.1     # pause between sampled frames
+    min_sharpness = 50.0     # Laplacian variance below this counts as blurry
+    burst_keep = 5           # number of best frames to encode
+    template_mode = 'set'    # 'set' stores every encoding, 'mean' stores their average
+    # Duplicate checks
+    duplicate_distance = DUPLICATE_DISTANCE  # face enrolled under another email
+    same_user_distance = MATCH_DISTANCE      # face matches the account of its own email
+    max_templates = 10       # encodings kept per user when a re-registration is merged
+
     def __init__(self, page):
         super().__init__()
         self.page = page
         self.running = True
-        self.face_detector = FaceDetector()
-        self.camera = None
-        self.init_camera()
+        self.inference = get_inference()
+        self.camera = get_camera()
         
         self.img = ft.Image(
             border_radius=ft.border_radius.all(20),
             width=299,
             height=299
         )
+        self.preview = PreviewStreamer(self.camera, self, self.img, crop=self.crop_frame)
         self.capture_face_button = ft.Row(
             controls=[
                 ft.Container(
@@ -39,73 +55,27 @@ class RegisterFace(ft.UserControl):
             vertical_alignment='center'
         )
         
-    def init_camera(self):
-        """Initialize the camera with error handling"""
-        if self.camera is not None and self.camera.isOpened():
-            self.camera.release()
-        
-        # Try different camera indices
-        for index in range(2):  # Try camera 0 and 1
-            self.camera = cv2.VideoCapture(index)
-            if self.camera.isOpened():
-                # Set camera resolution
-                self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                break
-        
-        if not self.camera.isOpened():
-            print("Error: Could not open camera")
-            self.show_snackbar("Error: Could not access camera")
-
     def did_mount(self):
-        self.update_cam_timer()
+        self.running = True
+        self.camera.acquire()
+        self.preview.start()
 
     def will_unmount(self):
         self.running = False
-        if self.camera is not None:
-            self.camera.release()
-
-    def update_cam_timer(self):
-        def update():
-            while self.running:
-                if self.camera is None or not self.camera.isOpened():
-                    self.init_camera()
-                    time.sleep(1)
-                    continue
-
-                ret, frame = self.camera.read()
-                if not ret or frame is None:
-                    print("Error: Failed to grab frame")
-                    time.sleep(0.1)
-                    continue
-
-                try:
-                    # Get center crop coordinates
-                    height, width = frame.shape[:2]
-                    start_y = max(0, (height - 299) // 2)
-                    start_x = max(0, (width - 299) // 2)
-                    
-                    # Crop frame to center
-                    cropped_frame = frame[start_y:start_y+299, start_x:start_x+299]
-                    
-                    # Check if crop was successful
-                    if cropped_frame.shape[:2] != (299, 299):
-                        cropped_frame = cv2.resize(frame, (299, 299))
-                    
-                    # Convert to base64
-                    _, im_arr = cv2.imencode('.png', cropped_frame)
-                    im_b64 = base64.b64encode(im_arr)
-                    
-                    # Update image in UI
-                    self.img.src_base64 = im_b64.decode("utf-8")
-                    self.update()
-                    
-                except Exception as e:
-                    print(f"Error processing frame: {e}")
-                
-                time.sleep(0.033)  # Cap at ~30 FPS
-
-        threading.Thread(target=update, daemon=True).start()
+        self.preview.stop()
+        self.camera.release()
+
+    def crop_frame(self, frame):
+        """Center crop a camera frame to 299x299"""
+        height, width = frame.shape[:2]
+        start_y = max(0, (height - 299) // 2)
+        start_x = max(0, (width - 299) // 2)
+        cropped_frame = frame[start_y:start_y+299, start_x:start_x+299]
+        
+        # Ensure correct size
+        if cropped_frame.shape[:2] != (299, 299):
+            cropped_frame = cv2.resize(frame, (299, 299))
+        return cropped_frame
 
     def build(self):
         return ft.Column(
@@ -137,38 +107,121 @@ class RegisterFace(ft.UserControl):
         }
         self.page.session.set("session", session_data)
 
-    def capture_image(self, e=None):
-        if self.camera is None or not self.camera.isOpened():
-            self.show_snackbar("Camera not available. Please check your camera connection.")
+    @timed('capture_image.duplicate_check')
+    def check_duplicate(self, email, face_encodings):
+        """Decide how to treat this enrollment; returns (action, existing encodings).
+
+        'new' for a fresh user; 'merge' when the email is already enrolled with
+        this face; 'reject_email' when the email belongs to a different face and
+        'reject_face' when the face is already enrolled under another email.
+        """
+        existing = open_encoding_store().get(email)
+        if get_user_repository().get_by_email(email) is not None:
+            if existing is not None:
+                matcher = GalleryMatcher(existing, [email] * len(existing))
+                if matcher.distance_matrix(face_encodings).min() > self.same_user_distance:
+                    return 'reject_email', existing
+            return 'merge', existing
+
+        # One batched nearest-neighbour query for all burst encodings
+        gallery = get_gallery()
+        gallery.refresh()
+        for hits in gallery.snapshot().search_many(face_encodings):
+            if hits and hits[0][0] != email and hits[0][1] <= self.duplicate_distance:
+                return 'reject_face', existing
+        return 'new', existing
+
+    @timed('capture_image.merge')
+    def merge_registration(self, email, face_encodings, existing):
+        """Add new encodings to an enrolled user, up to max_templates in total"""
+        room = self.max_templates - (len(existing) if existing is not None else 0)
+        if room <= 0:
             return
+        if self.template_mode == 'mean':
+            face_encodings = [np.mean(face_encodings, axis=0)]
+        face_encodings = list(face_encodings)[:room]
+        self.save_encodings([email] * len(face_encodings), face_encodings)
+
+    def save_encodings(self, user_ids, face_encodings):
+        """Append encodings to the store and the shared gallery; returns the store path"""
+        # The gallery adds them to its index in memory and saves the index file later, off this thread
+        return get_gallery().add(user_ids, face_encodings)
+
+    @timed('capture_image.save')
+    def save_registration(self, frame, face_encodings, fullname, email, telephone):
+        """Persist the face image, encodings, index entries and user record"""
+        # Save face image
+        save_dir = os.path.join('application_data', "user_faces")
+        os.makedirs(save_dir, exist_ok=True)
+        image_path = os.path.join(save_dir, f'{email}.jpg')
+        cv2.imwrite(image_path, frame)
+        get_thumbnail_cache().get(image_path)  # Render the profile thumbnail now, not on first view
+
+        # Save face encodings, either the whole set or one mean template
+        if self.template_mode == 'mean':
+            face_encodings = [np.mean(face_encodings, axis=0)]
+        encoding_path = self.save_encodings([email] * len(face_encodings), face_encodings)
+        
+        # Prepare user data
+        user_data = {
+            "fullname": fullname,
+            "email": email,
+            "telephone": telephone,
+            "face_image": image_path,
+            "face_encoding": encoding_path,
+            "date_registered": datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+        }
+        
+        # Save user record
+        get_user_repository().add_user(user_data)
+
+    @timed('capture_image.burst')
+    def capture_burst(self):
+        """Sample frames for burst_seconds, keeping sharp ones that contain a face.
 
-        ret, frame = self.camera.read()
-        if not ret or frame is None:
-            self.show_snackbar("Failed to capture image. Please try again.")
+        Returns [(sharpness, frame, face_location)] sorted sharpest first. The
+        blur check runs before detection so bad frames are rejected cheaply.
+        """
+        candidates = []
+        frame_id = 0
+        deadline = time.monotonic() + self.burst_seconds
+        while time.monotonic() < deadline:
+            frame_id, frame = self.camera.wait_for_frame(frame_id, timeout=self.burst_seconds)
+            if frame is None:
+                continue
+            frame = self.crop_frame(frame)
+            score = sharpness(frame)
+            if score >= self.min_sharpness:
+                face_location = self.inference.detect_face(frame)
+                if face_location:
+                    candidates.append((score, frame, face_location))
+            time.sleep(self.burst_interval)
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return candidates
+
+    @timed('capture_image')
+    def capture_image(self, e=None):
+        if not self.camera.is_opened():
+            self.show_snackbar("Camera not available. Please check your camera connection.")
             return
 
         try:
-            # Get center crop
-            height, width = frame.shape[:2]
-            start_y = max(0, (height - 299) // 2)
-            start_x = max(0, (width - 299) // 2)
-            frame = frame[start_y:start_y+299, start_x:start_x+299]
-            
-            # Ensure correct size
-            if frame.shape[:2] != (299, 299):
-                frame = cv2.resize(frame, (299, 299))
-
-            # Detect face using MediaPipe
-            face_location = self.face_detector.detect_face(frame)
-            if not face_location:
+            self.show_snackbar("Hold still while we capture your face...")
+            candidates = self.capture_burst()
+            if not candidates:
                 self.show_snackbar("No face detected. Please position your face properly.")
                 return
 
-            # Get face encoding
-            face_encoding = get_face_encoding(frame)
-            if face_encoding is None:
+            # Encode the sharpest frames, reusing their MediaPipe boxes
+            face_encodings = []
+            for _, frame, face_location in candidates[:self.burst_keep]:
+                face_encoding = self.inference.encode_face(frame, face_location)
+                if face_encoding is not None:
+                    face_encodings.append(face_encoding)
+            if not face_encodings:
                 self.show_snackbar("Unable to process face. Please try again.")
                 return
+            best_frame = candidates[0][1]
 
             # Get user data
             fullname = self.page.client_storage.get("fullname")
@@ -180,47 +233,24 @@ class RegisterFace(ft.UserControl):
                 self.page.go('/signup')
                 return
 
-            # Save face image
-            save_dir = os.path.join('application_data', "user_faces")
-            os.makedirs(save_dir, exist_ok=True)
-            image_path = os.path.join(save_dir, f'{email}.jpg')
-            cv2.imwrite(image_path, frame)
-
-            # Save face encoding
-            save_encoding = os.path.join('application_data', 'user_faces_encoding')
-            os.makedirs(save_encoding, exist_ok=True)
-            encoding_path = os.path.join(save_encoding, f'{email}_encoding.npy')
-            np.save(encoding_path, face_encoding)
-            
-            # Prepare user data
-            user_data = {
-                "fullname": fullname,
-                "email": email,
-                "telephone": telephone,
-                "face_image": image_path,
-                "face_encoding": encoding_path,
-                "date_registered": datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-            }
-            
-            # Load existing data or create new file
-            if os.path.exists('registered_faces.json'):
-                with open('registered_faces.json', 'r') as f:
-                    all_users = json.load(f)
+            action, existing = self.check_duplicate(email, face_encodings)
+            if action == 'reject_email':
+                self.show_snackbar("This email is already registered with a different face.")
+                return
+            if action == 'reject_face':
+                self.show_snackbar("This face is already registered. Please sign in instead.")
+                return
+            if action == 'merge':
+                self.merge_registration(email, face_encodings, existing)
+                self.show_snackbar('Face updated for your existing registration!')
             else:
-                all_users = []
-
-            # Add new user data
-            all_users.append(user_data)
-
-            # Save updated data
-            with open('registered_faces.json', 'w') as f:
-                json.dump(all_users, f, indent=4)
-            
-            self.show_snackbar('Face registered successfully!')
+                self.save_registration(best_frame, face_encodings, fullname, email, telephone)
+                self.show_snackbar('Face registered successfully!')
             
             # Clear client_storage and create session
             #self.page.client_storage.clear()
             self.create_session(email)
+            self.page.client_storage.set("registered_email", email)  # shown by the /user page
             self.page.go('/user')
 
         except Exception as e:
@@ -1,34 +1,48 @@
 import flet as ft
-import cv2
-import mediapipe as mp
-import threading
-import base64
-import os, time
-import json
-import numpy as np
-from face_utils import FaceDetector, get_face_encoding, compare_faces
-
-mp_face_detection = mp.solutions.face_detection
-cap = cv2.VideoCapture(0)
+import time
+from face_utils import FaceTracker
+from inference_server import get_inference
+from user_store import get_user_repository
+from camera import get_camera
+from preview import PreviewStreamer
+from recognition import ContinuousRecognizer, get_recognition_worker
+from metrics import timed
 
 class SignInPage(ft.UserControl):
-    def __init__(self, page):
+    threshold = 0.6  # Adjust this threshold as needed
+
+    def __init__(self, page, continuous=False):
         super().__init__()
         self.page = page
-        self.face_detector = FaceDetector()
+        self.inference = get_inference()
+        self.camera = get_camera()
+        self.worker = get_recognition_worker()
         self.running = True
         self.img = ft.Image(
             border_radius=ft.border_radius.all(20),
             width=299,
             height=299
         )
+        self.preview = PreviewStreamer(
+            self.camera, self, self.img,
+            crop=lambda frame: frame[120:120+299, 200:200+299, :],
+            on_frame=self.on_preview_frame
+        )
+        # Opt-in hands-free mode: recognise straight from the preview stream
+        # Between full detections the face is followed with a cheap tracker
+        self.face_tracker = FaceTracker(self.inference)
+        self.continuous = ContinuousRecognizer(
+            self.worker, self.face_tracker.detect_face, self.identify, self.on_continuous_match
+        )
+        self.continuous_switch = ft.Switch(label='Hands-free sign in', value=continuous)
+        self.signin_label = ft.Text('Capture face', text_align=ft.TextAlign.CENTER, size=18)
         self.signin_button =  ft.Row(
             controls=[
                 ft.Container(
                     border_radius=5,
                     expand=True,
                     bgcolor=ft.colors.GREEN,
-                    content=ft.Text('Capture face', text_align=ft.TextAlign.CENTER, size=18),
+                    content=self.signin_label,
                     padding=ft.padding.only(left=25, right=25, top=10, bottom=10),
                     on_click=self.sign_in,
                 )
@@ -38,24 +52,17 @@ class SignInPage(ft.UserControl):
         )
 
     def did_mount(self):
-        self.update_frame()
+        self.running = True
+        self.continuous.reset()
+        self.face_tracker.reset()
+        self.camera.acquire()
+        self.preview.start()
 
     def will_unmount(self):
         self.running = False
-        cap.release()
-
-    def update_frame(self):
-        def update():
-            while self.running:
-                ret, frame = cap.read()
-                if ret:
-                    frame = frame[120:120+299, 200:200+299, :]
-                    _, im_arr = cv2.imencode('.png', frame)
-                    im_b64 = base64.b64encode(im_arr)
-                    self.img.src_base64 = im_b64.decode("utf-8")
-                    self.update()
-
-        threading.Thread(target=update, daemon=True).start()
+        self.worker.cancel()
+        self.preview.stop()
+        self.camera.release()
 
     def build(self):
         return ft.Column(
@@ -64,17 +71,14 @@ class SignInPage(ft.UserControl):
                 ft.Text('Welcome to the SignIn Page', size=24, weight=ft.FontWeight.BOLD, text_align='center'),
                 ft.Divider(height=20, color='transparent'),
                 self.img,
-                ft.Divider(height=50, color='transparent'),
+                ft.Divider(height=20, color='transparent'),
+                self.continuous_switch,
+                ft.Divider(height=20, color='transparent'),
                 self.signin_button
             ],
             horizontal_alignment=ft.CrossAxisAlignment.CENTER
         )
     
-    def detect_face(self, image):
-        with mp_face_detection.FaceDetection(min_detection_confidence=0.5) as face_detection:
-            results = face_detection.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-            return bool(results.detections)
-        
     def create_session(self, email):
         expiration_time = int(time.time()) + 24 * 60 * 60  # Current time + 24 hours
         session_data = {
@@ -94,49 +98,74 @@ class SignInPage(ft.UserControl):
         snackbar.open = True
         self.page.update()  # Refresh the page to show the snackbar
 
+    def set_recognizing(self, recognizing):
+        """Show the recognizing state on the capture button"""
+        self.signin_label.value = 'Recognizing...' if recognizing else 'Capture face'
+        self.signin_button.controls[0].bgcolor = ft.colors.GREY_700 if recognizing else ft.colors.GREEN
+        # The page instance is reused across visits: an unmounted page keeps the
+        # state for its next mount but cannot be updated now
+        if self.running:
+            self.update()
+
     def sign_in(self, e=None):
-        ret, frame = cap.read()
-        frame = frame[120:120 + 299, 200:200 + 299, :]
+        ret, frame = self.camera.read()
         if not ret:
             self.show_snackbar('Camera error. Please try again.')
             return
+        frame = frame[120:120 + 299, 200:200 + 299, :]
 
-        # Detect face using MediaPipe
-        face_location = self.face_detector.detect_face(frame)
-        if not face_location:
-            self.show_snackbar("No face detected. Please position your face properly.")
+        # Recognition runs on the worker thread. Submitting is the busy check, so a
+        # hands-free frame queued in between cannot leave the button stuck
+        future = self.worker.submit(self.recognize, frame, on_done=self.on_recognized)
+        if future is None:
+            self.show_snackbar('Recognition already in progress. Please wait.')
             return
+        self.set_recognizing(True)
+        # Added after set_recognizing so a job that already finished still resets the button
+        future.add_done_callback(self.on_recognition_finished)
 
-        # Get face encoding using face_recognition
-        unknown_encoding = get_face_encoding(frame)
-        if unknown_encoding is None:
-            self.show_snackbar("Unable to process face. Please try again.")
-            return
+    @timed('signin.recognize')
+    def recognize(self, frame, cancelled):
+        """Detect, encode and match frame; returns (user, message). Runs on the worker."""
+        result = self.inference.recognize(frame)
+        if not result.box:
+            return None, "No face detected. Please position your face properly."
+        if not result.encoded:
+            return None, "Unable to process face. Please try again."
+        if result.user is None:
+            return None, "No registered users found. Please sign up first."
+        if cancelled.is_set():
+            return None, None
+
+        best_match = get_user_repository().get_by_email(result.user)
+        if best_match and result.similarity >= self.threshold:
+            return best_match, f"Welcome back, {best_match['fullname']}!"
+        return None, "Face not recognized. Please try again."
+
+    def identify(self, frame, face_location):
+        """Email of the user at face_location if they pass the threshold, else None"""
+        result = self.inference.recognize(frame, face_location)
+        return result.user if result.similarity >= self.threshold else None
 
-        if os.path.exists('registered_faces.json'):
-            with open('registered_faces.json', 'r') as f:
-                user_data = json.load(f)
-
-            best_match = None
-            best_similarity = -1
-            
-            for user in user_data:
-                registered_encoding = np.load(user['face_encoding'])
-                similarity = compare_faces(registered_encoding, unknown_encoding)
-                
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = user
-
-            threshold = 0.6  # Adjust this threshold as needed
-            
-            if best_similarity >= threshold:
-                self.show_snackbar(f"Welcome back, {best_match['fullname']}!")
-                self.create_session(best_match['email'])
-                self.page.client_storage.set("recognized_user_data", best_match)
-                self.page.go('/display_recognized_user')
-            else:
-                self.show_snackbar("Face not recognized. Please try again.")
-        else:
-            self.show_snackbar("No registered users found. Please sign up first.")
-        
\ No newline at end of file
+    def on_preview_frame(self, frame):
+        if self.continuous_switch.value:
+            self.continuous.feed(frame)
+
+    def on_continuous_match(self, email):
+        best_match = get_user_repository().get_by_email(email)
+        if best_match:
+            self.on_recognized((best_match, f"Welcome back, {best_match['fullname']}!"))
+
+    def on_recognition_finished(self, future):
+        self.set_recognizing(False)
+
+    def on_recognized(self, result):
+        best_match, message = result
+        if not self.running:
+            return
+        if message:
+            self.show_snackbar(message)
+        if best_match:
+            self.create_session(best_match['email'])
+            self.page.client_storage.set("recognized_user_data", best_match)
+            self.page.go('/display_recognized_user')
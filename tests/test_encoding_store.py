@@ -0,0 +1,160 @@
+# tests/test_encoding_store.py
+import os
+import struct
+import numpy as np
+import pytest
+
+import encoding_store
+from encoding_store import (HEADER_SIZE, MAGIC, EncodingStore, convert_store, dequantize, import_npy_files,
+                            open_encoding_store, quantize)
+
+
+def random_encodings(count, seed=0):
+    return np.random.default_rng(seed).normal(scale=0.1, size=(count, 128)).astype(np.float32)
+
+
+def write_v1_store(path, ids, encodings, capacity=8, id_width=256):
+    """A version 1 file as written before the scale table and dtype code existed"""
+    with open(path, 'wb') as f:
+        f.truncate(HEADER_SIZE + capacity * (128 * 4 + id_width))
+        f.write(struct.pack('<4sIIQQI', MAGIC, 1, 128, len(ids), capacity, id_width).ljust(HEADER_SIZE, b'\0'))
+        f.write(np.asarray(encodings, dtype=np.float32).tobytes())
+        f.seek(HEADER_SIZE + capacity * 128 * 4)
+        f.write(np.array([user_id.encode() for user_id in ids], dtype=f'S{id_width}').tobytes())
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'enc.bin')
+    encodings = random_encodings(3)
+    store = EncodingStore(path)
+    assert store.extend(['a', 'b', 'a'], encodings) == [0, 1, 2]
+    store.close()
+
+    reopened = EncodingStore(path)
+    assert reopened.version == 2
+    assert reopened.ids() == ['a', 'b', 'a']
+    np.testing.assert_array_equal(reopened.encodings(), encodings)
+    np.testing.assert_array_equal(reopened.get('a'), encodings[[0, 2]])
+    assert reopened.get('missing') is None
+    assert 'b' in reopened and 'c' not in reopened
+
+
+def test_reads_and_appends_to_version_1(tmp_path):
+    path = str(tmp_path / 'enc.bin')
+    encodings = random_encodings(2)
+    write_v1_store(path, ['a', 'b'], encodings)
+
+    store = EncodingStore(path)
+    assert store.version == 1 and store.dtype == 'float32'
+    np.testing.assert_array_equal(store.encodings(), encodings)
+    extra = random_encodings(1, seed=1)
+    store.append('c', extra[0])
+    store.close()
+
+    reopened = EncodingStore(path)
+    assert reopened.version == 1
+    assert reopened.ids() == ['a', 'b', 'c']
+    np.testing.assert_array_equal(reopened.get('c'), extra)
+
+
+def test_grow_keeps_rows(tmp_path):
+    path = str(tmp_path / 'enc.bin')
+    encodings = random_encodings(150)
+    store = EncodingStore(path)
+    for row, encoding in enumerate(encodings):
+        store.append(f'user{row}', encoding)
+    assert store.capacity == 256
+    np.testing.assert_array_equal(store.encodings(), encodings)
+    assert store.get('user149') is not None
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_handles_see_each_others_rows(tmp_path):
+    path = str(tmp_path / 'enc.bin')
+    first, second = EncodingStore(path), EncodingStore(path)
+    encodings = random_encodings(4)
+    first.append('ui1', encodings[0])
+    second.append('bulk1', encodings[1])
+    # Growing through one handle replaces the file under the other
+    first.extend([f'grow{i}' for i in range(100)], random_encodings(100, seed=1))
+    second.append('bulk2', encodings[2])
+
+    ids = EncodingStore(path).ids()
+    assert ids[:2] == ['ui1', 'bulk1']
+    assert ids[-1] == 'bulk2' and len(ids) == 103
+
+
+def test_id_width_overflow(tmp_path):
+    store = EncodingStore(str(tmp_path / 'enc.bin'), id_width=8)
+    with pytest.raises(ValueError):
+        store.append('much-too-long@example.com', random_encodings(1)[0])
+    assert len(store) == 0
+
+
+def test_import_npy_files_is_idempotent(tmp_path):
+    legacy = tmp_path / 'legacy'
+    legacy.mkdir()
+    encodings = random_encodings(2)
+    np.save(legacy / 'a@example.com_encoding.npy', encodings[0])
+    np.save(legacy / 'b@example.com_encoding.npy', encodings[1])
+    (legacy / 'broken_encoding.npy').write_bytes(b'not numpy')
+
+    store = EncodingStore(str(tmp_path / 'enc.bin'))
+    assert import_npy_files(store, str(legacy)) == 2
+    assert import_npy_files(store, str(legacy)) == 0
+    assert sorted(store.ids()) == ['a@example.com', 'b@example.com']
+    np.testing.assert_array_equal(store.get('b@example.com')[0], encodings[1])
+
+
+def test_open_encoding_store_imports_only_when_created(tmp_path, monkeypatch):
+    legacy = tmp_path / 'legacy'
+    legacy.mkdir()
+    np.save(legacy / 'a@example.com_encoding.npy', random_encodings(1)[0])
+    monkeypatch.setattr(encoding_store, 'LEGACY_ENCODING_DIR', str(legacy))
+    path = str(tmp_path / 'enc.bin')
+
+    assert len(open_encoding_store(path)) == 1
+    np.save(legacy / 'b@example.com_encoding.npy', random_encodings(1)[0])
+    assert len(open_encoding_store(path)) == 1
+
+
+def test_generation_changes_on_write(tmp_path):
+    path = str(tmp_path / 'enc.bin')
+    store = EncodingStore(path)
+    created = store.generation
+    store.append('a', random_encodings(1)[0])
+    assert store.generation != created
+    assert EncodingStore(path).generation == store.generation
+
+
+@pytest.mark.parametrize('dtype, tolerance', [('float16', 1e-3), ('int8', 5e-3)])
+def test_quantize_round_trip(dtype, tolerance):
+    encodings = random_encodings(50)
+    rows, scale = quantize(encodings, dtype)
+    assert rows.dtype == np.dtype(dtype)
+    assert (scale is not None) == (dtype == 'int8')
+    np.testing.assert_allclose(dequantize(rows, scale), encodings, atol=tolerance)
+
+
+def test_int8_clips_outside_scale():
+    rows, scale = quantize(np.full((1, 128), 10.0), 'int8', np.full(128, 0.01, dtype=np.float32))
+    assert rows.max() == 127
+    np.testing.assert_allclose(dequantize(rows, scale), 1.27, rtol=1e-6)
+
+
+@pytest.mark.parametrize('dtype', ['float16', 'int8'])
+def test_convert_store(tmp_path, dtype):
+    source = EncodingStore(str(tmp_path / 'source.bin'))
+    encodings = random_encodings(20)
+    source.extend([f'user{i % 7}' for i in range(20)], encodings)
+
+    converted = convert_store(source, str(tmp_path / 'converted.bin'), dtype)
+    converted.close()
+    reopened = EncodingStore(str(tmp_path / 'converted.bin'))
+    assert reopened.dtype == dtype
+    assert reopened.ids() == source.ids()
+    assert reopened.raw_encodings().dtype == np.dtype(dtype)
+    np.testing.assert_allclose(reopened.encodings(), encodings, atol=5e-3)
+
+    with pytest.raises(ValueError):
+        convert_store(source, str(tmp_path / 'converted.bin'), dtype)
@@ -0,0 +1,105 @@
+# thumbnails.py
+import os
+import io
+import glob
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+THUMBNAIL_DIR = os.path.join('application_data', 'thumbnails')
+THUMBNAIL_SIZE = (299, 299)
+
+
+class ThumbnailCache:
+    """Display-ready base64 thumbnails of the stored face images.
+
+    A thumbnail is resized and encoded once, written to directory and kept
+    in a small in-memory LRU, so profile pages send a ready string instead of
+    decoding, resizing and re-encoding the photo on every build. Entries are
+    keyed by the source path with its modification time and size, so a
+    replaced photo gets a fresh thumbnail and the stale file is removed.
+    """
+    def __init__(self, directory=THUMBNAIL_DIR, size=THUMBNAIL_SIZE, memory_items=64, quality=90):
+        self.directory = directory
+        self.size = size
+        self.memory_items = memory_items
+        self.quality = quality
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _signature(self, path):
+        """(name prefix for path, cache file name for its current version), or None if missing"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        prefix = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return prefix, f"{prefix}_{stat.st_mtime_ns}_{stat.st_size}_{self.size[0]}x{self.size[1]}.jpg"
+
+    def get(self, path):
+        """Base64 JPEG thumbnail of the image at path, or None if it does not exist"""
+        signature = self._signature(path)
+        if signature is None:
+            return None
+        prefix, name = signature
+        with self.lock:
+            data = self.memory.get(name)
+            if data is not None:
+                self.memory.move_to_end(name)
+                return data
+
+        cached_path = os.path.join(self.directory, name)
+        try:
+            with open(cached_path, 'rb') as f:
+                thumbnail = f.read()
+        except OSError:
+            thumbnail = self._render(path)
+            if thumbnail is None:
+                return None
+            self._write(prefix, cached_path, thumbnail)
+
+        data = base64.b64encode(thumbnail).decode()
+        with self.lock:
+            self.memory[name] = data
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+        return data
+
+    def _render(self, path):
+        try:
+            with Image.open(path) as img:
+                img = img.convert('RGB').resize(self.size) # resize image for display
+                buffered = io.BytesIO()
+                img.save(buffered, format='JPEG', quality=self.quality)
+                return buffered.getvalue()
+        except OSError as e:
+            print(f"Error creating thumbnail for {path}: {e}")
+            return None
+
+    def _write(self, prefix, cached_path, thumbnail):
+        """Store thumbnail and drop older versions for the same source"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for stale in glob.glob(os.path.join(self.directory, prefix + '_*.jpg')):
+                os.remove(stale)
+            tmp_path = cached_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(thumbnail)
+            os.replace(tmp_path, cached_path)
+        except OSError as e:
+            print(f"Error writing thumbnail cache: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache():
+    """Process-wide ThumbnailCache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ThumbnailCache()
+        return _cache
@@ -1,9 +1,6 @@
-import os
-import io
-import json
-import base64
 import flet as ft
-from PIL import Image
+from thumbnails import get_thumbnail_cache
+from user_store import get_user_repository
 
 class User(ft.UserControl):
     def __init__(self, page):
@@ -31,21 +28,14 @@ class User(ft.UserControl):
         )
 
     def get_latest_user(self):
-        if os.path.exists('registered_faces.json'):
-            with open('registered_faces.json', 'r') as f:
-                all_users = json.load(f)
-                if all_users:
-                    return all_users[-1] # return the last registered user
-        return None
+        # The user who just registered or re-registered, else the last registered user
+        email = self.page.client_storage.get("registered_email")
+        user = get_user_repository().get_by_email(email) if email else None
+        return user or get_user_repository().get_latest_user()
     
     def load_image(self, path):
-        if os.path.exists(path):
-            with Image.open(path) as img:
-                img = img.resize((299, 299)) # resize image for display
-                buffered = io.BytesIO()
-                img.save(buffered, format='PNG')
-                return base64.b64encode(buffered.getvalue()).decode()
-        return None
+        # Thumbnails are rendered once and cached, not on every build
+        return get_thumbnail_cache().get(path)
     
     def build(self):
         if not self.user_data:
@@ -0,0 +1,147 @@
+# user_store.py
+import os
+import json
+import sqlite3
+import threading
+from contextlib import closing
+
+USER_DB_PATH = os.path.join('application_data', 'users.db')
+LEGACY_REGISTRY_PATH = 'registered_faces.json'
+
+USER_FIELDS = ('fullname', 'email', 'telephone', 'face_image', 'face_encoding', 'date_registered')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fullname TEXT NOT NULL,
+    email TEXT NOT NULL,
+    telephone TEXT,
+    face_image TEXT,
+    face_encoding TEXT,
+    date_registered TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+INSERT_USER = f"INSERT INTO users ({', '.join(USER_FIELDS)}) VALUES ({', '.join('?' * len(USER_FIELDS))})"
+
+
+class UserRepository:
+    """Registered users in a SQLite database (WAL mode, stdlib only).
+
+    Replaces registered_faces.json: inserts are single atomic transactions,
+    lookups by email go through an index and the latest user is read from
+    the end of the primary key instead of parsing the whole registry.
+    Records are returned as plain dicts with the same keys the JSON used.
+    """
+    def __init__(self, path=USER_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # A connection per call keeps the repository safe to use from the
+        # preview and capture threads without sharing sqlite objects
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_dict(row):
+        return {field: row[field] for field in USER_FIELDS} if row else None
+
+    def add_user(self, user_data):
+        """Insert one user record atomically and return its row id"""
+        values = [user_data.get(field) for field in USER_FIELDS]
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(INSERT_USER, values)
+            return cursor.lastrowid
+
+    def add_users(self, users):
+        """Insert many user records in one transaction"""
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(INSERT_USER, [[user.get(field) for field in USER_FIELDS] for user in users])
+
+    def get_by_email(self, email):
+        """Most recent record registered with email, or None"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT * FROM users WHERE email = ? ORDER BY id DESC LIMIT 1', (email,)
+            ).fetchone()
+        return self._to_dict(row)
+
+    def get_latest_user(self):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT * FROM users ORDER BY id DESC LIMIT 1').fetchone()
+        return self._to_dict(row)
+
+    def all_users(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT * FROM users ORDER BY id').fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def count(self):
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def remove_duplicate_emails(self):
+        """Keep only the latest record per email; returns the number of records removed"""
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute('DELETE FROM users WHERE id NOT IN (SELECT MAX(id) FROM users GROUP BY email)')
+            return cursor.rowcount
+
+    def migrate_from_json(self, json_path=LEGACY_REGISTRY_PATH):
+        """Import registered_faces.json once; later calls are no-ops.
+
+        Returns the number of users imported.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        # Plain read first: once migrated, opening the repository takes no write lock
+        with closing(self._connect()) as conn:
+            if conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+        with closing(self._connect()) as conn, conn:
+            # Take the write lock up front so two processes cannot both migrate
+            conn.execute('BEGIN IMMEDIATE')
+            done = conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+            if done:
+                return 0
+            with open(json_path, 'r') as f:
+                all_users = json.load(f)
+            conn.executemany(INSERT_USER, [[user.get(field) for field in USER_FIELDS] for user in all_users])
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (json_path,))
+        return len(all_users)
+
+
+def open_user_repository(path=USER_DB_PATH):
+    """Open the default repository, importing the legacy JSON registry once"""
+    repository = UserRepository(path)
+    imported = repository.migrate_from_json()
+    if imported:
+        print(f"Imported {imported} users from {LEGACY_REGISTRY_PATH} into {path}")
+    return repository
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_user_repository():
+    """Process-wide repository; schema setup and the JSON migration run once"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = open_user_repository()
+        return _repository
+
+
+if __name__ == '__main__':
+    repository = UserRepository()
+    print(f"Imported {repository.migrate_from_json()} users into {repository.path}")
@@ -0,0 +1,156 @@
+# video_recognition.py
+"""Recognise faces in a video file or stream without the UI.
+
+Usage:
+    python video_recognition.py lobby.mp4 --out results.jsonl
+    python video_recognition.py rtsp://camera.local/stream --every 5 --max-frames 1000
+
+Any cv2.VideoCapture source works (a file, a URL or a camera index). Frames
+are decoded on one thread and handed to detection, encoding and matching on
+another through a small bounded queue, so decoding keeps going while a frame
+is being recognised without running ahead of it. Every sampled frame gets a
+JSON line with the faces found and who they matched.
+"""
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+
+import cv2
+
+from encoding_store import open_encoding_store
+from face_utils import GalleryMatcher, encode_faces, get_face_detector, warm_up_models
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+def read_frames(source, every=1, max_frames=None):
+    """Yield (frame_index, position_ms, frame) for every `every`-th frame of source"""
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not capture.isOpened():
+        raise IOError(f"Unable to open video source {source}")
+    try:
+        index, yielded = 0, 0
+        while max_frames is None or yielded < max_frames:
+            # Skipped frames are only grabbed, never decoded into an image
+            if index % every:
+                if not capture.grab():
+                    return
+                index += 1
+                continue
+            ret, frame = capture.read()
+            if not ret:
+                return
+            yield index, capture.get(cv2.CAP_PROP_POS_MSEC), frame
+            index += 1
+            yielded += 1
+    finally:
+        capture.release()
+
+
+def prefetch(iterable, size=8):
+    """Iterate iterable on a background thread, staying at most size items ahead.
+
+    Errors raised by the producer are re-raised in the consumer; closing the
+    returned generator stops the producer.
+    """
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_Failed(e))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+        put(_DONE)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failed):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def recognize_frames(frames, detector, matcher, threshold=0.6):
+    """Yield one result dict per (frame_index, position_ms, frame)"""
+    for index, position_ms, frame in frames:
+        boxes = detector.detect_faces(frame)
+        faces = []
+        if boxes:
+            for box, result in zip(boxes, matcher.match_many(encode_faces(frame, boxes))):
+                recognized = result.user is not None and result.similarity >= threshold
+                faces.append({
+                    'box': [int(v) for v in box],
+                    'user': result.user if recognized else None,
+                    'similarity': round(float(result.similarity), 4),
+                })
+        yield {'frame': index, 'position_ms': round(position_ms, 1), 'faces': faces}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='video file, stream URL or camera index')
+    parser.add_argument('--out', default='-', help='JSONL output file (default: stdout)')
+    parser.add_argument('--every', type=int, default=1, help='recognise every n-th frame')
+    parser.add_argument('--max-frames', type=int, help='stop after this many sampled frames')
+    parser.add_argument('--prefetch', type=int, default=8, help='decoded frames buffered ahead of inference')
+    parser.add_argument('--threshold', type=float, default=0.6, help='minimum similarity to report a user')
+    args = parser.parse_args()
+
+    matcher = GalleryMatcher.from_store(open_encoding_store())
+    detector = get_face_detector()
+    warm_up_models()
+
+    frames = prefetch(read_frames(args.source, max(1, args.every), args.max_frames), args.prefetch)
+    out = sys.stdout if args.out == '-' else open(args.out, 'w')
+    processed, faces, start = 0, 0, time.perf_counter()
+    try:
+        for result in recognize_frames(frames, detector, matcher, args.threshold):
+            out.write(json.dumps(result) + '\n')
+            processed += 1
+            faces += len(result['faces'])
+            if processed % 100 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{processed} frames, {processed / elapsed:.1f} frames/s", file=sys.stderr)
+    except IOError as e:
+        print(f"Error reading {args.source}: {e}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    fps = processed / elapsed if elapsed else 0.0
+    print(f"Processed {processed} frames ({faces} faces) in {elapsed:.1f} s: {fps:.1f} frames/s sustained",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()